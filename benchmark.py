@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from tabulate import tabulate
+
+import clases
+import generator
+
+EXPORTS = [clases.export_game_days, clases.export_game_days_csv, clases.export_refs_info,
+           clases.export_refs_info_csv, clases.create_history, clases.days_out_stats, clases.export_all]
+
+
+class TimedBacktrack(clases.Backtrack):
+    # Backtrack that keeps when the search reaches each day for the first time
+    def __init__(self, nba):
+        super().__init__(nba)
+        self.reached = {}  # dict with {[DATE] = perf_counter}
+
+    def day_frame(self, day):
+        self.reached.setdefault(day, time.perf_counter())
+        return super().day_frame(day)
+
+
+def best_of(function, repeat):
+    # median seconds of 'repeat' calls
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_instance(folder, repeat=3):
+    # {[metric] = seconds} for one data folder
+    results = {}
+
+    loads = [clases.load_nba(folder, cache=False).load_times for _ in range(repeat)]
+    for loader in loads[0]:
+        results[loader] = statistics.median(load[loader] for load in loads)
+    results["load_nba"] = statistics.median(sum(load.values()) for load in loads)
+    clases.load_nba(folder)  # writes the cache
+    results["load_nba_cache"] = best_of(lambda: clases.load_nba(folder), repeat)
+
+    nba = clases.load_nba(folder)
+    results["order_costs"] = best_of(lambda: [nba.order_costs(game) for game in nba.game_list], repeat)
+    results["update_valid_refs_per_game"] = best_of(lambda: [nba.update_valid_refs_per_game(day)
+                                                             for day in nba.games], repeat)
+    for game in nba.game_list:
+        game.valid_referees = None
+
+    bk = TimedBacktrack(nba)
+    start = time.perf_counter()
+    if not bk.run(1):
+        raise Exception("No se encontro solucion para {}".format(folder))
+    end = time.perf_counter()
+    results["backtrack_run"] = end - start
+
+    reached = sorted(bk.reached.items()) + [(nba.season_end, end)]
+    days = [following - current for (day, current), (_, following) in zip(reached, reached[1:])]
+    results["backtrack_day_median"] = statistics.median(days)
+    results["backtrack_day_max"] = max(days)
+
+    with tempfile.TemporaryDirectory() as output:
+        for export in EXPORTS:
+            results[export.__name__] = best_of(lambda: export(nba, folder=output), repeat)
+    return results
+
+
+def compare(results, baseline, threshold=0.20, minimum=0.001):
+    # rows [metric, baseline, now, ratio, status]; a regression is slower by more than 'threshold' and 'minimum' s
+    rows = []
+    for metric, seconds in results.items():
+        old = baseline.get(metric)
+        if old is None:
+            rows.append([metric, "", seconds, "", "new"])
+            continue
+        ratio = seconds / old if old else float("inf")
+        status = "regression" if ratio > 1 + threshold and seconds - old > minimum else "ok"
+        rows.append([metric, old, seconds, round(ratio, 3), status])
+    return rows
+
+
+def run(folders, repeat=3):
+    # {[instance/metric] = seconds}
+    results = {}
+    for name, folder in folders:
+        for metric, seconds in bench_instance(folder, repeat).items():
+            results["{}/{}".format(name, metric)] = round(seconds, 6)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide los tiempos de los seeds, rankings, backtracking y exports")
+    parser.add_argument("--datos", default="datos")
+    parser.add_argument("--escalas", nargs="*", type=int, default=[],
+                        help="instancias sinteticas con 'escala' veces los equipos y arbitros de la liga")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default="resultados/benchmark.json")
+    parser.add_argument("--baseline", default=None, help="json de una corrida anterior para comparar")
+    parser.add_argument("--umbral", type=float, default=0.20, help="cuanto mas lento es una regresion (0.20: 20%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scaled:
+        folders = [("datos", args.datos)]
+        for scale in args.escalas:
+            folder = os.path.join(scaled, "x{}".format(scale))
+            generator.generate(folder, teams=30 * scale, referees=121 * scale, seed=scale)
+            folders.append(("x{}".format(scale), folder))
+        results = run(folders, args.repeticiones)
+
+    with open(args.salida, "w") as file:
+        json.dump(results, file, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    rows = compare(results, baseline, args.umbral)
+    print(tabulate(rows, headers=["Metric", "Baseline (s)", "Now (s)", "Ratio", "Status"]))
+
+    if any(row[-1] == "regression" for row in rows):
+        sys.exit(1)
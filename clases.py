@@ -1,33 +1,334 @@
+import cProfile
 import datetime
 import csv
-import sys
+import hashlib
+import json
+import os
 import pprint
+import sys
+import time
+from contextlib import ExitStack
+from collections.abc import Mapping
 
-sys.setrecursionlimit(10000)
+import numpy as np
 from tabulate import tabulate
 import csv
 
-sum_days_away = 0
-count_days_away = 0
-count_one_days_away = 0
-count_fourplus_days_away = 0
-count_seven_days_away = 0
-assigned = 0
-reused = 0
 
-maximo_de_partidos = None
-rango_de_escoger_arbitros = 1.00
+# nombres de ciudades de referees.csv que en locations.csv estan en ingles (o con el equipo en otra ciudad)
+TRANSLATE_CITIES = {"auburn hills": "detroit",  # esto esta por mientras
+                    "filadelfia": "philadelphia",
+                    "los ángeles": "los angeles",
+                    "nueva orleans": "new orleans",
+                    "indianápolis": "indianapolis",
+                    "nueva york": "new york"}
+
+# archivos que lee load_nba, en orden, con el seed de cada uno
+SEASON_FILES = [("seed_locations", "locations.csv"),
+                ("seed_games", "games.csv"),
+                ("seed_distances", "distances (mi & km).csv"),
+                ("seed_flight_costs", "flight costs.csv"),
+                ("seed_referees", "referees.csv")]
+SEASON_CACHE = ".season.npz"  # seeds ya leidos, junto a los csv
+SEASON_CACHE_VERSION = 1  # change it when season_arrays changes
+
+
+class SolverConfig:
+    def __init__(self, maximo_de_partidos=None, rango_de_escoger_arbitros=1.00):
+        # maximo de partidos que un arbitro puede arbitrar en la temporada (None: sin limite)
+        self.maximo_de_partidos = maximo_de_partidos
+        # rango de costo sobre el arbitro 'optimo' en que se prefiere uno que no haya arbitrado nunca
+        self.rango_de_escoger_arbitros = rango_de_escoger_arbitros
+
+    def __repr__(self):
+        return "SolverConfig(maximo_de_partidos={}, rango_de_escoger_arbitros={})".format(
+            self.maximo_de_partidos, self.rango_de_escoger_arbitros)
+
+
+class SolverStats:
+    def __init__(self):
+        self.assigned = 0
+        self.reused = 0
+        self.sum_days_away = 0
+        self.count_days_away = 0
+        self.count_one_days_away = 0
+        self.count_fourplus_days_away = 0
+        self.count_seven_days_away = 0
+
+    def summary(self):
+        return {"assigned": self.assigned,
+                "reused": self.reused,
+                "ratio_reused": self.reused / self.assigned if self.assigned else 0,
+                "avg_days_out": self.sum_days_away / self.count_days_away if self.count_days_away else 0,
+                "times_out": self.count_days_away,
+                "times_one_day_out": self.count_one_days_away,
+                "times_four_plus_days_out": self.count_fourplus_days_away,
+                "times_seven_days_out": self.count_seven_days_away}
+
+
+class SolverMetrics:
+    # per day counters of a run, indexed by day; opt-in with NBA.metrics
+    FIELDS = ("is_valid", "candidates", "assignments", "undos", "max_depth", "seconds")
+
+    def __init__(self, days, profile=None):
+        self.is_valid = [0] * days  # calls to Referee.is_valid
+        self.candidates = [0] * days  # referees scanned in Backtrack.next_referee_to_asign
+        self.assignments = [0] * days
+        self.undos = [0] * days  # assignments undone by the backtracking
+        self.max_depth = [0] * days  # deepest stack of frames reached on the day
+        self.seconds = [0.0] * days  # wall time of the search while on the day
+        self.profile = profile  # file for the cProfile stats of Backtrack.run (None: no profiling)
+
+    def rows(self):
+        # one dict per day with any activity
+        for day in range(len(self.is_valid)):
+            row = {field: getattr(self, field)[day] for field in self.FIELDS}
+            if any(row.values()):
+                row["seconds"] = round(row["seconds"], 6)
+                yield dict(day=day, **row)
+
+    def write_jsonl(self, file):
+        with open(file, "w") as jsonl:
+            for row in self.rows():
+                jsonl.write(json.dumps(row) + "\n")
+
+
+class Trail:
+    # journal of the changes made while solving, reverting replays it backwards
+    def __init__(self):
+        self.entries = []
+
+    def mark(self):
+        return len(self.entries)
+
+    def set(self, obj, name, value):
+        old = getattr(obj, name)
+        if old != value:
+            self.entries.append((setattr, (obj, name, old)))
+            setattr(obj, name, value)
+
+    def push(self, undo, *args):  # undo(*args) reverts a change already made
+        self.entries.append((undo, args))
+
+    def undo(self, mark):
+        while len(self.entries) > mark:
+            undo, args = self.entries.pop()
+            undo(*args)
+
+
+COST_CATEGORIES = ["flight_to_game_city", "days_waiting", "aditional_income_waiting", "hotel_waiting_city",
+                   "aditional_income_refeering", "hotel_game_city", "flight_to_home_city"]
+CATEGORY_INDEX = {name: i for i, name in enumerate(COST_CATEGORIES)}
+MONEY = np.array([name != "days_waiting" for name in COST_CATEGORIES])  # days_waiting are days, not money
+# what a referee does each day in NBA.occupancy, stored as City.index << 2 | status
+OCCUPANCY_STATUS = ["home", "waiting", "principal", "colaborador"]
+HOME, WAITING, PRINCIPAL, COLABORADOR = range(len(OCCUPANCY_STATUS))
+LEDGER_ROW = np.dtype([("referee", np.int32), ("game", np.int32), ("day", np.int16), ("category", np.int8),
+                       ("amount", np.int64)])  # same order as CostLedger.columns
+
+
+class CostLedger:
+    # every cost of the season as rows of (referee, game, day, category, amount), in the order they were posted
+    def __init__(self, referees, games, capacity=4096):
+        self.referees = referees  # list of Referee, position = Referee.index
+        self.games = games  # list of Game, position = Game.index
+
+        self.size = 0
+        self.referee = np.zeros(capacity, dtype=np.int32)
+        self.game = np.zeros(capacity, dtype=np.int32)
+        self.day = np.zeros(capacity, dtype=np.int16)
+        self.category = np.zeros(capacity, dtype=np.int8)
+        self.amount = np.zeros(capacity, dtype=np.int64)
+
+        # running totals with [Referee.index / Game.index, category] = total
+        self.referee_totals = np.zeros((len(referees), len(COST_CATEGORIES)), dtype=np.int64)
+        self.game_totals = np.zeros((len(games), len(COST_CATEGORIES)), dtype=np.int64)
+
+    @property
+    def columns(self):
+        return [self.referee, self.game, self.day, self.category, self.amount]
+
+    def post(self, referee, game, detail_key, cost):
+        if self.size == len(self.amount):
+            self.referee, self.game, self.day, self.category, self.amount = \
+                [np.concatenate([column, np.zeros_like(column)]) for column in self.columns]
+
+        i = self.size
+        category = CATEGORY_INDEX[detail_key]
+        cost = int(cost)
+        self.referee[i] = referee.index
+        self.game[i] = game.index
+        self.day[i] = game.day
+        self.category[i] = category
+        self.amount[i] = cost
+        self.size += 1
+
+        self.referee_totals[referee.index, category] += cost
+        self.game_totals[game.index, category] += cost
+
+    def copy(self):
+        # structured array with the rows posted so far, the totals come back from them in CostLedger.load
+        rows = np.empty(self.size, dtype=LEDGER_ROW)
+        for name, column in zip(LEDGER_ROW.names, self.columns):
+            rows[name] = column[:self.size]
+        return rows
+
+    def load(self, rows):
+        self.size = len(rows)
+        capacity = max(len(self.amount), self.size)
+        self.referee, self.game, self.day, self.category, self.amount = \
+            [np.concatenate([rows[name], np.zeros(capacity - self.size, dtype=rows.dtype[name])])
+             for name in LEDGER_ROW.names]
+
+        self.referee_totals = np.zeros((len(self.referees), len(COST_CATEGORIES)), dtype=np.int64)
+        self.game_totals = np.zeros((len(self.games), len(COST_CATEGORIES)), dtype=np.int64)
+        np.add.at(self.referee_totals, (rows["referee"], rows["category"]), rows["amount"])
+        np.add.at(self.game_totals, (rows["game"], rows["category"]), rows["amount"])
+
+    def truncate(self, size):
+        # undo: drops every row posted after 'size'
+        rows = slice(size, self.size)
+        np.subtract.at(self.referee_totals, (self.referee[rows], self.category[rows]), self.amount[rows])
+        np.subtract.at(self.game_totals, (self.game[rows], self.category[rows]), self.amount[rows])
+        self.size = size
+
+    def rows(self, referee=None, game=None):
+        mask = np.ones(self.size, dtype=bool)
+        if referee is not None:
+            mask &= self.referee[:self.size] == referee.index
+        if game is not None:
+            mask &= self.game[:self.size] == game.index
+        return np.flatnonzero(mask)
+
+    def groups(self, column):
+        # for every Referee.index ('referee') or Game.index ('game') its rows in the order they were posted,
+        # sorting the ledger once instead of a CostLedger.rows per object
+        keys = getattr(self, column)[:self.size]
+        order = np.argsort(keys, kind="stable")
+        count = len(self.referees) if column == "referee" else len(self.games)
+        bounds = np.searchsorted(keys[order], np.arange(count + 1)).tolist()
+        return [order[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def costs(self, referee=None, game=None, rows=None):
+        # nested dict with {[Game or Referee] = {[detail] = [costs]}}, keyed by the side not given.
+        # 'rows' are the rows of that referee or game if they're already known (see CostLedger.groups)
+        costs = {}
+        if rows is None:
+            rows = self.rows(referee, game)
+        keys = self.game[rows] if referee is not None else self.referee[rows]
+        objects = self.games if referee is not None else self.referees
+        for key, category, amount in zip(keys.tolist(), self.category[rows].tolist(), self.amount[rows].tolist()):
+            entry = costs.setdefault(objects[key], {})
+            entry.setdefault(COST_CATEGORIES[category], []).append(amount)
+        return costs
+
+    def totals_by(self, column, money=True):
+        # group-by of the amounts over 'referee', 'game', 'day' or 'category'
+        keys = getattr(self, column)[:self.size]
+        amounts = self.amount[:self.size]
+        if money:
+            amounts = amounts * MONEY[self.category[:self.size]]
+        totals = np.zeros(int(keys.max()) + 1 if self.size else 0, dtype=np.int64)
+        np.add.at(totals, keys, amounts)
+        return totals
+
+    @property
+    def total(self):
+        return int(self.game_totals[:, MONEY].sum())
+
+
+class RefereeState:
+    # dynamic state of every referee as arrays, position = Referee.index
+    DYNAMIC = ("city", "resting", "days_away", "last_day", "seven_days_out", "four_days_out")
+
+    def __init__(self, referees):
+        self.home = np.array([r.home.index for r in referees], dtype=np.int64)
+        self.city = self.home.copy()  # City.index where the referee is now
+        self.aditional_income = np.array([r.aditional_income for r in referees], dtype=np.int64)
+
+        self.resting = np.full(len(referees), 4, dtype=np.int64)
+        self.days_away = np.zeros(len(referees), dtype=np.int64)
+        self.last_day = np.zeros(len(referees), dtype=np.int64)  # last day refereed, 0 if never
+        self.seven_days_out = np.ones(len(referees), dtype=np.int64)
+        self.four_days_out = np.full(len(referees), 8, dtype=np.int64)
+
+    @property
+    def max_days_away(self):
+        return np.where(self.seven_days_out > 0, 7, np.where(self.four_days_out > 0, 6, 3))
+
+
+class SeasonSnapshot:
+    # dynamic state of a season between two days packed in structured arrays, see NBA.snapshot and NBA.restore
+    __slots__ = ("referees", "games", "ledger", "stats", "occupancy", "rankings", "day")
+
+    def __init__(self, referees, games, ledger, stats, occupancy, rankings=None, day=None):
+        self.referees = referees  # one record per Referee.index with the RefereeState.DYNAMIC fields
+        self.games = games  # one record per Game.index with its referees, roles and i_valid_referees, -1 if empty
+        self.ledger = ledger  # CostLedger.copy()
+        self.stats = stats  # one record with the SolverStats attributes
+        self.occupancy = occupancy  # copy of NBA.occupancy
+        # checkpoints only (NBA.snapshot(day)): valid_referees of the games, one record per referee of each
+        # ranking, and the day the search goes on from
+        self.rankings = rankings
+        self.day = day
+
+    @property
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def fork(self):
+        return SeasonSnapshot(**{name: array.copy() for name, array in self.arrays.items()})
+
+    def save(self, file, compressed=False):
+        if compressed:  # a quarter of the size, slower
+            np.savez_compressed(file, **self.arrays)
+        else:
+            np.savez(file, **self.arrays)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+class CityTable(Mapping):
+    # dict-like view {[City] = value} over the row of a city in a cities x cities matrix
+    __slots__ = ("table", "city", "cities")
+
+    def __init__(self, table, city, cities):
+        self.table = table
+        self.city = city
+        self.cities = cities  # list of City, position = City.index
+
+    def __getitem__(self, to_city):
+        return int(self.table[self.city.index, to_city.index])
+
+    def __setitem__(self, to_city, value):
+        self.table[self.city.index, to_city.index] = value
+
+    def __iter__(self):
+        return iter(self.cities)
+
+    def __len__(self):
+        return len(self.cities)
 
 
 class City:
-    def __init__(self, id, city):
+    __slots__ = ("id", "city", "index", "_hotel_cost", "team", "distances", "flights", "referees")
+
+    def __init__(self, id, city, index):
         self.id = id
         self.city = city
+        self.index = index  # row/column of the city in NBA.flight_table and NBA.distance_table
         self._hotel_cost = None
         self.team = None
 
-        self.distances = {}  # dict with {[City] = distance (mi)}
-        self.flights = {}  # dict with {[City] = cost}
+        self.distances = {}  # dict with {[City] = distance (mi)}, a CityTable once the tables exist
+        self.flights = {}  # dict with {[City] = cost}, a CityTable once the tables exist
         self.referees = []  # list with actual refeeres (Referee)
 
     @property
@@ -54,16 +355,14 @@ class City:
             self.distances[city] = 0
             return
 
-        if city not in self.distances:
+        if not self.distances[city]:
             self.distances[city] = distance
 
-        if self not in city.distances:
+        if not city.distances[self]:
             city.distances[self] = distance
 
     def add_flight(self, to_city, cost):
-        cost = int(cost)
-        if to_city not in self.flights:
-            self.flights[to_city] = cost
+        self.flights[to_city] = int(cost)
 
     def add_referee(self, referee):
         if referee not in self.referees:
@@ -73,6 +372,8 @@ class City:
 
 
 class Team:
+    __slots__ = ("name", "code", "arena", "city", "games")
+
     def __init__(self, code):
         self.name = None
         self.code = code
@@ -92,6 +393,8 @@ class Team:
 
 
 class Channel:
+    __slots__ = ("name", "games")
+
     def __init__(self, name):
         self.name = name
         self.games = []
@@ -104,6 +407,9 @@ class Channel:
 
 
 class Game:
+    __slots__ = ("home", "away", "date", "day", "index", "referees", "principal", "colaboradores", "channel", "ledger",
+                 "valid_referees", "i_valid_referees")
+
     def __init__(self, home, away, date, day, channel):
         self.home = home
         self.home.add_game(self)
@@ -113,27 +419,31 @@ class Game:
 
         self.date = date
         self.day = int(day)
-        self.referees = []
+        self.index = None  # position in NBA.game_list
+        self.referees = ()  # at most 3, a tuple is enough
 
         self.principal = None
-        self.colaboradores = []
+        self.colaboradores = ()
 
         self.channel = channel
         if self.channel:
             self.channel.add_game(self)
 
-        self.costs = {}
+        self.ledger = None  # CostLedger of the season
         self.valid_referees = None
         self.i_valid_referees = 0  # el i que recorre la lista anterior
 
+    @property
+    def costs(self):
+        return self.ledger.costs(game=self)  # dict with {[Referee] = {[detail] = [costs]}}
+
     @property
     def total_cost(self):
-        total_cost = 0
-        for item in self.costs.values():
-            for desc, entry in item.items():
-                if desc != "days_waiting":
-                    total_cost += sum(entry)
-        return total_cost
+        return int(self.ledger.game_totals[self.index, MONEY].sum())
+
+    @property
+    def cost_by_category(self):
+        return dict(zip(COST_CATEGORIES, self.ledger.game_totals[self.index].tolist()))
 
     @property
     def costs_pretty(self):
@@ -146,30 +456,11 @@ class Game:
         return pp.pformat(pretty)
 
     def add_cost(self, producer_key, detail_key, cost):
-        cost = int(cost)
-
-        if producer_key not in self.costs:
-            self.costs[producer_key] = {}
-
-        if detail_key not in self.costs[producer_key]:
-            self.costs[producer_key][detail_key] = []
-
-        self.costs[producer_key][detail_key].append(cost)
-
-    def remove_cost(self, producer_key, detail_key, cost):
-        cost = int(cost)
-
-        self.costs[producer_key][detail_key].remove(cost)
-
-        if not self.costs[producer_key][detail_key]:
-            del self.costs[producer_key][detail_key]
-
-        if not self.costs[producer_key]:
-            del self.costs[producer_key]
+        self.ledger.post(producer_key, self, detail_key, cost)
 
     def assign_ref(self, ref):
         if self.has_all_refs():
-            raise Exception("All refs are assigned to this game {}".format(vars(self)))
+            raise Exception("All refs are assigned to this game {}".format(self.debug()))
 
         if not self.can_assign_ref(ref):
             raise Exception("Error. Can't assign referee or it will be invalid")
@@ -177,11 +468,11 @@ class Game:
         if not ref.current_city == self.home.city:
             raise Exception("Error. Referee has not travelled yet.")
 
-        self.referees.append(ref)
+        self.referees += (ref,)
         ref.refgames.append(self)
 
     def undo_assign_ref(self, ref):
-        self.referees.remove(ref)
+        self.referees = tuple(r for r in self.referees if r != ref)
         ref.refgames.remove(self)
 
     def can_assign_ref(self, ref):  # check if referee is allowed to be assigned
@@ -197,13 +488,13 @@ class Game:
 
         principales = 0
         colaboradores = 0
-        for referee in self.referees + [ref]:
+        for referee in self.referees + (ref,):
             if referee.type == "principal":  # use lowercase
                 principales += 1
             if referee.type == "colaborador":
                 colaboradores += 1
 
-        for referee in self.referees + [ref]:
+        for referee in self.referees + (ref,):
             if referee.type == "principal y colaborador":  # use lowercase
                 if principales == 0:
                     principales += 1
@@ -259,20 +550,20 @@ class Game:
     def set_refs_types(self):
         for ref in self.referees:
             if ref.type == "colaborador":
-                self.colaboradores.append(ref)
+                self.colaboradores += (ref,)
             elif ref.type == "principal y colaborador":
                 # si no hay principal lo asigno de principal, sino colaborador
                 if not self.principal and ref.can_be_principal(self):
                     self.principal = ref
                 else:
-                    self.colaboradores.append(ref)
+                    self.colaboradores += (ref,)
             elif ref.type == "principal":
                 # si ya se asigno un principal, entonces lo muevo a colaborador
                 if self.principal:
                     if self.principal.type != "principal y colaborador":
                         raise Exception("Esto no deberia pasar")
 
-                    self.colaboradores.append(self.principal)
+                    self.colaboradores += (self.principal,)
 
                 if not ref.can_be_principal(self):
                     raise Exception("No puede ser principal")
@@ -281,6 +572,13 @@ class Game:
 
         if not self.principal:
             raise Exception("No se pudo escoger principal")
+        self.principal.occupy(self.day, self.day + 1, self.home.city, PRINCIPAL)
+
+    def clear_refs_types(self):
+        if self.principal:
+            self.principal.occupy(self.day, self.day + 1, self.home.city, COLABORADOR)
+        self.principal = None
+        self.colaboradores = ()
 
     def ref_type(self, ref):
         if ref not in self.referees:
@@ -293,10 +591,22 @@ class Game:
         else:
             raise Exception("Error")
 
+    def debug(self):
+        return {"index": self.index,
+                "day": self.day,
+                "home": self.home.code,
+                "away": self.away.code,
+                "channel": self.channel and self.channel.name,
+                "referees": [r.id for r in self.referees]}
+
 
 class Referee:
+    __slots__ = ("id", "index", "type", "home", "income", "aditional_income", "nba", "state", "refgames", "timeline",
+                 "ledger", "cost_marks")
+
     def __init__(self, id, type, city, income, aditional_income):
         self.id = id
+        self.index = None  # position in NBA.referees
         self.type = type.strip().lower()
 
         self.home = city
@@ -307,17 +617,15 @@ class Referee:
         self.income = int(income)
         self.aditional_income = int(aditional_income)
 
-        self.resting = 4
-        self.days_away = 0
+        self.nba = None  # NBA the referee belongs to (config, stats and eligibility)
+        self.state = None  # RefereeState with resting, days_away, etc. of all the referees
 
         self.refgames = []
 
         self.timeline = [self.home]  # cities where it've been
 
-        self.seven_days_out = 1
-        self.four_days_out = 8
-
-        self.costs = {}
+        self.ledger = None  # CostLedger of the season
+        self.cost_marks = []  # ledger size before each game in refgames was assigned
 
     @property
     def current_city(self):
@@ -325,24 +633,47 @@ class Referee:
 
     @property
     def last_day_refer(self):
-        return self.refgames[-1].day if self.refgames else 0
+        return int(self.state.last_day[self.index])
+
+    @property
+    def resting(self):
+        return int(self.state.resting[self.index])
+
+    @resting.setter
+    def resting(self, value):
+        self.state.resting[self.index] = value
+
+    @property
+    def days_away(self):
+        return int(self.state.days_away[self.index])
+
+    @days_away.setter
+    def days_away(self, value):
+        self.state.days_away[self.index] = value
+
+    @property
+    def seven_days_out(self):
+        return int(self.state.seven_days_out[self.index])
+
+    @seven_days_out.setter
+    def seven_days_out(self, value):
+        self.state.seven_days_out[self.index] = value
+
+    @property
+    def four_days_out(self):
+        return int(self.state.four_days_out[self.index])
+
+    @four_days_out.setter
+    def four_days_out(self, value):
+        self.state.four_days_out[self.index] = value
 
     def can_be_principal(self, game):
-        if not self.refgames:
-            return True
+        # it can't be principal two days in a row
+        return self.nba.occupancy[self.index, game.day - 1] & 3 != PRINCIPAL
 
-        compare_game = self.refgames[-1]
-        i = 1
-        while compare_game == game:
-            if len(self.refgames) <= i:  # si hay un solo juego no tengo con que comparar
-                return True
-            compare_game = self.refgames[-i]
-            i += 1
-        if compare_game:
-            if compare_game.day == game.day - 1:
-                if compare_game.ref_type(self) == "principal":
-                    return False
-        return True
+    def occupy(self, from_day, to_day, city, status):
+        # NBA.occupancy of the days from 'from_day' to 'to_day' - 1
+        self.nba.occupancy[self.index, from_day:to_day] = city.index << 2 | status
 
     @property
     def max_days_away(self):
@@ -352,14 +683,17 @@ class Referee:
             return 6
         return 3  # else
 
+    @property
+    def costs(self):
+        return self.ledger.costs(referee=self)  # dict with {[Game] = {[detail] = [costs]}}
+
     @property
     def total_cost(self):
-        total_cost = 0
-        for item in self.costs.values():
-            for desc, entry in item.items():
-                if desc != "days_waiting":
-                    total_cost += sum(entry)
-        return total_cost
+        return int(self.ledger.referee_totals[self.index, MONEY].sum())
+
+    @property
+    def cost_by_category(self):
+        return dict(zip(COST_CATEGORIES, self.ledger.referee_totals[self.index].tolist()))
 
     @property
     def costs_pretty(self):
@@ -372,29 +706,18 @@ class Referee:
         return pp.pformat(pretty)
 
     def add_cost(self, producer_key, detail_key, cost):
-        cost = int(cost)
-
-        if producer_key not in self.costs:
-            self.costs[producer_key] = {}
-
-        if detail_key not in self.costs[producer_key]:
-            self.costs[producer_key][detail_key] = []
-
-        self.costs[producer_key][detail_key].append(cost)
+        self.ledger.post(self, producer_key, detail_key, cost)
 
-    def remove_cost(self, producer_key, detail_key, cost):
-        cost = int(cost)
-
-        self.costs[producer_key][detail_key].remove(cost)
-
-        if not self.costs[producer_key][detail_key]:
-            del self.costs[producer_key][detail_key]
+    def is_valid(self, game):
+        # static rules of NBA.eligibility (can't refer at home nor home teams) and then the dynamic ones
+        return bool(self.nba.eligibility[self.index, game.index]) and self.is_available(game)
 
-        if not self.costs[producer_key]:
-            del self.costs[producer_key]
+    def is_available(self, game):
+        # the rules of is_valid that change during the season, for referees already known to be eligible
+        metrics = self.nba.metrics
+        if metrics is not None:
+            metrics.is_valid[game.day] += 1
 
-    def is_valid(self, game):
-        global maximo_de_partidos
         if self in game.referees:  # it's already on the game
             # print("on game")
             return False
@@ -406,13 +729,6 @@ class Referee:
             # print("one per day")
             return False
 
-        if self.home == game.home.city:  # can't refer at home
-            # print("not at home")
-            return False
-
-        if self.home == game.away.city:  # can't refer home teams
-            return False
-
         if self.current_city == self.home and self.resting <= 3:  # if at home, it must rest at least 3 days
             # print("resting: {}".format(self.resting))
             return False
@@ -425,6 +741,7 @@ class Referee:
             if not self.can_be_principal(game):
                 return False
 
+        maximo_de_partidos = self.nba.config.maximo_de_partidos
         if maximo_de_partidos and len(self.refgames) >= maximo_de_partidos:  # analisis de sensibilidad
             return False
 
@@ -437,105 +754,50 @@ class Referee:
             to_city.referees.append(self)
 
         self.timeline.append(to_city)
+        self.state.city[self.index] = to_city.index
 
     def undo_travel_to(self):
         old_city = self.current_city
         self.timeline = self.timeline[:-1]
+        self.state.city[self.index] = self.current_city.index
 
         if self.current_city != old_city:
             old_city.referees.remove(self)
             self.current_city.referees.append(self)  # current city now is the old (-1) city
 
-    def move_home(self, day):
-        global sum_days_away, count_days_away, count_one_days_away, count_fourplus_days_away, count_seven_days_away
+    def move_home(self, day, trail):
+        stats = self.nba.stats
         gap = day - self.last_day_refer
-        self.days_away -= gap
+        days_away = self.days_away - gap
 
-        sum_days_away += self.days_away
-        count_days_away += 1
+        trail.set(stats, "sum_days_away", stats.sum_days_away + days_away)
+        trail.set(stats, "count_days_away", stats.count_days_away + 1)
 
-        if self.days_away >= 7:
-            self.seven_days_out -= 1
-            count_seven_days_away += 1
-        if self.days_away >= 4:
-            self.four_days_out -= 1
-            count_fourplus_days_away += 1
-        if self.days_away == 1:
-            count_one_days_away += 1
+        if days_away >= 7:
+            trail.set(self, "seven_days_out", self.seven_days_out - 1)
+            trail.set(stats, "count_seven_days_away", stats.count_seven_days_away + 1)
+        if days_away >= 4:
+            trail.set(self, "four_days_out", self.four_days_out - 1)
+            trail.set(stats, "count_fourplus_days_away", stats.count_fourplus_days_away + 1)
+        if days_away == 1:
+            trail.set(stats, "count_one_days_away", stats.count_one_days_away + 1)
 
         self.travel_to(self.home)
-        self.resting = 1
+        trail.push(self.undo_travel_to)
 
+        resting = 1
         if gap > 0:
-            self.resting += gap - 1  # le sumamos 'resting' para simular que lo movimos hace gap
+            resting += gap - 1  # le sumamos 'resting' para simular que lo movimos hace gap
 
-        self.days_away = 0
+        trail.set(self, "resting", resting)
+        trail.set(self, "days_away", 0)
 
+        trail.push(self.ledger.truncate, self.ledger.size)
         last_game = self.refgames[-1]
-        last_game.add_cost(self, "flight_to_home_city", last_game.home.city.flights[self.home])
         self.add_cost(last_game, "flight_to_home_city", last_game.home.city.flights[self.home])
 
-    def undo_move_home(self, day):
-        # print("undo id {}\n{}".format(self.id, vars(self)))
-
-        i = 0
-        for city in list(reversed(self.timeline[:-1])):
-            if city == self.home:
-                break
-            i += 1
-        days_working = self.refgames[-1].day - self.refgames[-i].day + 1
-        days_waiting = day - self.last_day_refer
-        # print("days working {} | days waiting {}".format(days_working, days_waiting))
-        self.days_away = days_working + days_waiting
-
-        if days_working >= 7:
-            self.seven_days_out += 1
-            count_seven_days_away -= 1
-        if days_working >= 4:
-            self.four_days_out += 1
-            count_fourplus_days_away -= 1
-        if days_working == 1:
-            count_one_days_away -= 1
-
-        self.resting = 0
-
-        if self.days_away > self.max_days_away:
-            self.days_away = 0
-            self.resting = days_waiting
-            if days_working >= 7:
-                self.seven_days_out -= 1
-            if days_working >= 4:
-                self.four_days_out -= 1
-        else:
-            self.undo_travel_to()
-        '''
-        #gap = day - 1 - self.last_day_refer
-        #self.days_away += gap
-
-        if self.days_away > 7:
-            self.resting = day - self.last_day_refer
-            self.days_away = 0
-        else:
-        #if days_waiting >= 3 or self.days_away >= 7:
-            self.undo_travel_to()
-            self.resting = max(days_waiting - 3, 1)
-
-            if days_working >= 7:
-                self.seven_days_out += 1
-            if days_working >= 4:
-                self.four_days_out += 1
-
-            last_game = self.refgames[-1]
-            last_game.remove_cost(self, "flight_to_home_city", last_game.home.city.flights[self.home])
-            self.remove_cost(last_game, "flight_to_home_city", last_game.home.city.flights[self.home])
-        #else:# self.days_away >= self.max_days_away:
-
-        print(self.days_away - 1)
-        print(self.resting - 1)
-        '''
-
     def assign_game(self, game):
-        game.add_cost(self, "flight_to_game_city", self.flight_cost_to_game(game))
+        self.cost_marks.append(self.ledger.size)
         self.add_cost(game, "flight_to_game_city", self.flight_cost_to_game(game))
 
         days_waiting = 0
@@ -543,63 +805,40 @@ class Referee:
             days_waiting = game.day - self.last_day_refer - 1
 
         if days_waiting > 0:
-            game.add_cost(self, "days_waiting", days_waiting)
-            game.add_cost(self, "aditional_income_waiting", self.aditional_income * days_waiting)
-            game.add_cost(self, "hotel_waiting_city", self.current_city.hotel_cost * days_waiting)
-
             self.add_cost(game, "days_waiting", days_waiting)
             self.add_cost(game, "aditional_income_waiting", self.aditional_income * days_waiting)
             self.add_cost(game, "hotel_waiting_city", self.current_city.hotel_cost * days_waiting)
 
-        game.add_cost(self, "aditional_income_refeering", self.aditional_income)
-        game.add_cost(self, "hotel_game_city", game.home.city.hotel_cost)
         self.add_cost(game, "aditional_income_refeering", self.aditional_income)
         self.add_cost(game, "hotel_game_city", game.home.city.hotel_cost)
 
+        if self.current_city != self.home:
+            self.occupy(self.last_day_refer + 1, game.day, self.current_city, WAITING)
+        self.occupy(game.day, game.day + 1, game.home.city, COLABORADOR)  # principal in Game.set_refs_types
+
         self.travel_to(game.home.city)
         game.assign_ref(self)
+        self.state.last_day[self.index] = game.day
 
     def undo_assign_game(self, game):
+        # only valid undoing in LIFO order as Backtrack.advance does, with the day transitions after the game already
+        # reverted by the trail: the ledger is truncated to the size before the game
+        ledger = self.ledger
+        if (ledger.referee[self.cost_marks[-1]:ledger.size] != self.index).any():
+            raise Exception("Undo out of order: there are costs of other referees after the game {}".format(game.debug()))
         self.undo_travel_to()
         game.undo_assign_ref(self)
+        self.state.last_day[self.index] = self.refgames[-1].day if self.refgames else 0
+        if self.current_city != self.home:  # the days it waited for the game
+            self.occupy(self.last_day_refer + 1, game.day + 1, self.home, HOME)
+        else:
+            self.occupy(game.day, game.day + 1, self.home, HOME)
 
-        del self.costs[game]
-        del game.costs[self]
+        self.ledger.truncate(self.cost_marks.pop())  # drops the costs of the game and everything posted after
 
     def flight_cost_to_game(self, game):
         return self.current_city.flights[game.home.city]
 
-    def cost_to_game(self, game, nba):
-        flight_cost_from = self.flight_cost_to_game(game)
-
-        hotel_cost_current = self.current_city.hotel_cost
-        days_waiting = 0
-        if self.current_city != self.home:
-            days_waiting = game.day - self.last_day_refer - 1
-
-        hotel_cost_game = game.home.city.hotel_cost
-
-        flight_cost_to_home = game.home.city.flights[self.home]
-
-        old_flight_cost_to_home = 0
-        if self.current_city != self.home:
-            old_flight_cost_to_home = self.current_city.flights[self.home]
-
-        '''costo_de_sacarlo_de_ciudad_mismo_dia = 0
-        for nba_game in nba.games[game.day]:
-            if game != nba_game and nba_game.home.city == self.current_city and game.home.city != nba_game.home.city and self.is_valid(nba_game):
-                costo_de_sacarlo_de_ciudad_mismo_dia += self.current_city.flights[game.home.city]
-                costo_de_sacarlo_de_ciudad_mismo_dia += game.home.city.flights[self.current_city]'''
-
-        total_cost = flight_cost_from + \
-                     (hotel_cost_current + self.aditional_income) * days_waiting + \
-                     (hotel_cost_game + self.aditional_income) * 1 + \
-                     flight_cost_to_home - \
-                     old_flight_cost_to_home  # + \
-        # costo_de_sacarlo_de_ciudad_mismo_dia
-
-        return total_cost
-
     def better_before(self, game):
         hotel_cost_current = self.current_city.hotel_cost
         hotel_cost_game = game.home.city.hotel_cost
@@ -617,79 +856,264 @@ class Referee:
 
 
 class NBA:
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config or SolverConfig()
+        self.stats = SolverStats()
+
         self.cities = {}  # dict with {[NAME] = City}
         self.channels = {}  # dict with {[NAME] = Channel}
         self.teams = {}  # dict with {[CODE] = Team}
         self.games = {}  # dict with {[DATE] = [Games]}
+        self.game_list = []  # list of Games, position = Game.index
         self.referees = {}  # dict with {[CODE] = Referee}
+        self.team_names = {}  # dict with {[NAME] = Team}, the first team with that name
+        self.city_names = {}  # dict with {[City.city_name] = City}, the first city with that name
+        self.load_times = {}  # dict with {[loader] = seconds}, filled by load_nba
+        self.metrics = None  # SolverMetrics of the run, None to not record them
+
+        self.flight_table = None  # matrix with [City.index, City.index] = cost
+        self.distance_table = None  # matrix with [City.index, City.index] = distance (mi)
+        self.eligibility = None  # bool matrix with [Referee.index, Game.index] = passes the static rules
+        self.ledger = None  # CostLedger with every cost of the season
+        self.trail = Trail()  # changes made by the day transitions, to revert them
+        self.state = None  # RefereeState with the arrays of the referees dynamic state
+        # matrix with [Referee.index, DATE] = City.index << 2 | status (see OCCUPANCY_STATUS), the days not
+        # decided yet are at home
+        self.occupancy = None
 
     def update_all_refs(self, day):
-        for ref in self.referees.values():
-            if ref.current_city == ref.home:
-                ref.resting += 1
-                ref.days_away = 0
-            else:
-                ref.resting = 0
-                ref.days_away += 1
+        # every change goes to the trail, so trail.undo(mark) reverts the day exactly
+        trail = self.trail
+        state = self.state
+        at_home = state.city == state.home
+
+        resting = np.where(at_home, state.resting + 1, 0)
+        days_away = np.where(at_home, 0, state.days_away + 1)
+        changed = np.flatnonzero((resting != state.resting) | (days_away != state.days_away))
+        trail.push(np.put, state.resting, changed, state.resting[changed])
+        trail.push(np.put, state.days_away, changed, state.days_away[changed])
+        state.resting[changed] = resting[changed]
+        state.days_away[changed] = days_away[changed]
+
+        # si estuvo mas de 2 dias sin arbitrar, al 3ro es mejor devolverlo el dia despues de arbitrar,
+        # y si ya lleva el maximo de dias fuera tambien lo devolvemos
+        go_home = ~at_home & ((day - state.last_day >= 3) | (state.days_away >= state.max_days_away))
+        if go_home.any():
+            refs = list(self.referees.values())
+            for i in np.flatnonzero(go_home).tolist():
+                refs[i].move_home(day, trail)  # lo movemos 'hoy'
 
-            if ref.current_city != ref.home and day - ref.last_day_refer >= 3:
-                # si estuvo mas de 2 dias sin arbitrar, al 3ro es mejor devolverlo el dia despues de arbitrar
+    @property
+    def season_end(self):
+        return max(self.games) + 1  # first day after the last game
+
+    def commit_day(self, day, assignments):
+        # assigns a whole day decided by a solver, 'assignments' has [game, principal, [colaboradores]] for every
+        # game of the day, then moves the day forward
+        for game, principal, colaboradores in assignments:
+            for ref in [principal] + list(colaboradores):
+                if not ref.is_valid(game):
+                    raise Exception("Referee {} is not valid for game {}".format(ref.id, game.debug()))
+
+                if ref.refgames and ref.current_city != ref.home:
+                    self.stats.reused += 1
+                ref.assign_game(game)
+                self.stats.assigned += 1
+                if self.metrics is not None:
+                    self.metrics.assignments[day] += 1
 
-                ref.move_home(day)  # lo movemos 'hoy'
+            game.principal = principal
+            game.colaboradores = tuple(colaboradores)
+            principal.occupy(day, day + 1, game.home.city, PRINCIPAL)
 
-            if ref.days_away >= ref.max_days_away:
-                ref.move_home(day)
+        self.update_all_refs(day)
 
-    def revert_all_refs(self, day):
+    def finish_season(self, day):
         for ref in self.referees.values():
-            if ref.current_city == ref.home and day - ref.last_day_refer <= 3 and ref.resting <= 3:
-                ref.undo_move_home(day)
-            '''
-            if ref.current_city == ref.home and ref.refgames and \
-                    ref.resting == 3 and ref.days_away == 0:  # justo se fue a la casa
-                #print("{}".format(vars(ref)))
-                ref.undo_travel_to()
-
-                last_game = ref.refgames[-1]
-                last_game.remove_cost(ref, "flight_to_home_city", last_game.home.city.flights[ref.home])
-                ref.remove_cost(last_game, "flight_to_home_city", last_game.home.city.flights[ref.home])
-
-                ref.resting = 0
-
-                days_out = 0
-                for city in ref.timeline[::-1]:
-                    days_out += 1
-                    if city == ref.home:
-                        break
-                days_waiting = day - 1 - ref.last_day_refer
-                ref.days_away = days_out + days_waiting
-
-                if ref.seven_days_out > 0 and days_out == 8:
-                    ref.move_home(day)
-                    ref.seven_days_out += 1
-                elif ref.four_days_out > 0 and days_out > 4 and days_out <= 7:
-                    ref.move_home(day)
-                    ref.four_days_out += 1
-            '''
-            if ref.last_day_refer == day:
-                if len(ref.refgames) >= 2:
-                    penultimo = ref.refgames[-2]
-                    if not (ref.last_day_refer - penultimo.day <= 3):  # estaba en la casa y lo sacamos
-                        ref.resting = day - penultimo.day  # el resting es desde la ultima vez que estuvo en casa
-                else:
-                    ref.resting = day + 4  # el resting es desde el comienzo de la simulacion
+            if ref.current_city != ref.home:
+                self.trail.set(ref, "days_away", ref.days_away + 1)  # for stats
+                ref.move_home(day, self.trail)
+
+    def snapshot(self, day=None):
+        # with 'day' it's a checkpoint to go on with the search from 'day' (see Backtrack.resume), so it also
+        # keeps the rankings of the games
+        referees = np.empty(len(self.referees), dtype=[(name, np.int64) for name in RefereeState.DYNAMIC])
+        for name in RefereeState.DYNAMIC:
+            referees[name] = getattr(self.state, name)
+
+        # referees: game.referees in order, roles: [principal, colaboradores...]
+        games = np.full(len(self.game_list), -1, dtype=[("referees", np.int16, 3), ("roles", np.int16, 3),
+                                                        ("i_valid_referees", np.int16)])
+        for game in self.game_list:
+            games["i_valid_referees"][game.index] = game.i_valid_referees
+            if game.referees:
+                games["referees"][game.index, :len(game.referees)] = [ref.index for ref in game.referees]
+            if game.principal:
+                games["roles"][game.index, 0] = game.principal.index
+            if game.colaboradores:
+                games["roles"][game.index, 1:len(game.colaboradores) + 1] = [ref.index for ref in game.colaboradores]
+
+        stats = np.array(tuple(vars(self.stats).values()), dtype=[(name, np.int64) for name in vars(self.stats)])
+        if day is None:
+            return SeasonSnapshot(referees, games, self.ledger.copy(), stats, self.occupancy.copy())
+
+        rankings = [(game.index, ref.index, cost) for game in self.game_list
+                    if game.valid_referees for ref, cost in game.valid_referees]
+        rankings = np.array(rankings, dtype=[("game", np.int32), ("referee", np.int16), ("cost", np.int64)])
+        return SeasonSnapshot(referees, games, self.ledger.copy(), stats, self.occupancy.copy(), rankings,
+                              np.array(day))
+
+    def restore(self, snapshot):
+        # back to the state of 'snapshot'; the trail starts empty, so days before it can't be reverted
+        for name in RefereeState.DYNAMIC:
+            getattr(self.state, name)[:] = snapshot.referees[name]
+        self.ledger.load(snapshot.ledger)
+        self.occupancy[:] = snapshot.occupancy
+        self.stats = SolverStats()
+        for name in snapshot.stats.dtype.names:
+            setattr(self.stats, name, int(snapshot.stats[name]))
+        self.trail = Trail()
+
+        refs = list(self.referees.values())
+        for game, referees, roles in zip(self.game_list, snapshot.games["referees"].tolist(),
+                                         snapshot.games["roles"].tolist()):
+            game.referees = tuple(refs[r] for r in referees if r >= 0)
+            principal, *colaboradores = roles
+            game.principal = refs[principal] if principal >= 0 else None
+            game.colaboradores = tuple(refs[r] for r in colaboradores if r >= 0)
+            if not game.referees:  # the ranking of a game not assigned yet depends on a state that is gone
+                game.valid_referees = None
+                game.i_valid_referees = 0
+
+        if snapshot.rankings is not None:  # a checkpoint, the games get back their rankings
+            for game, i_valid_referees in zip(self.game_list, snapshot.games["i_valid_referees"].tolist()):
+                game.valid_referees = None
+                game.i_valid_referees = i_valid_referees
+            for g, r, cost in snapshot.rankings.tolist():
+                game = self.game_list[g]
+                if game.valid_referees is None:
+                    game.valid_referees = []
+                game.valid_referees.append([refs[r], cost])
+
+        # refgames, timeline and cost_marks come back from the flights in the ledger, in the order they were posted
+        for ref in refs:
+            ref.refgames = []
+            ref.timeline = [ref.home]
+            ref.cost_marks = []
+        ledger = self.ledger
+        rows = np.flatnonzero(np.isin(ledger.category[:ledger.size], [CATEGORY_INDEX["flight_to_game_city"],
+                                                                     CATEGORY_INDEX["flight_to_home_city"]]))
+        for i, r, g, category in zip(rows.tolist(), ledger.referee[rows].tolist(), ledger.game[rows].tolist(),
+                                     ledger.category[rows].tolist()):
+            ref = refs[r]
+            if category == CATEGORY_INDEX["flight_to_game_city"]:
+                ref.cost_marks.append(i)
+                ref.refgames.append(self.game_list[g])
+                ref.timeline.append(self.game_list[g].home.city)
+            else:
+                ref.timeline.append(ref.home)
 
-            if ref.resting > 0:
-                ref.resting -= 1
-            if ref.days_away > 0:
-                ref.days_away -= 1
+        for city in self.cities.values():
+            city.referees = []
+        for ref in refs:
+            ref.current_city.referees.append(ref)
+
+    def schedule(self):
+        # dict with {[DATE] = [[Game, principal, [colaboradores]]]}, the format of commit_day
+        return {day: [[game, game.principal, list(game.colaboradores)] for game in games]
+                for day, games in self.games.items()}
+
+    def reset_season(self):
+        # back to the state right after the seeds, keeping the referees rankings of each game
+        refs = list(self.referees.values())
+        self.stats = SolverStats()
+        self.trail = Trail()
+        self.init_ledger()
+        self.state = RefereeState(refs)
+
+        for city in self.cities.values():
+            city.referees = []
+        for ref in refs:
+            ref.state = self.state
+            ref.refgames = []
+            ref.timeline = [ref.home]
+            ref.cost_marks = []
+            ref.home.add_referee(ref)
+        for game in self.game_list:
+            game.referees = ()
+            game.clear_refs_types()
+        self.init_occupancy()
+
+    def replay(self, schedule, from_day=1, to_day=None):
+        # solves the season again with the assignments of 'schedule' (see NBA.schedule), from 'from_day' and
+        # before 'to_day'. Without 'to_day' it goes to the end of the season
+        for day in range(from_day, to_day or self.season_end):
+            if day in self.games:
+                self.commit_day(day, schedule[day])
+            else:  # SOME DAYS DON'T HAVE GAMES
+                self.update_all_refs(day)
+
+        if to_day is None:
+            self.finish_season(self.season_end)
+
+    def fingerprint(self):
+        # hash of what the next days depend on: the referees state, how many games each one has and if it was
+        # principal of its last game. Two seasons with the same fingerprint at the start of a day go on the same way
+        refs = list(self.referees.values())
+        games = np.array([len(ref.refgames) for ref in refs], dtype=np.int64)
+        principal = np.array([bool(ref.refgames) and ref.refgames[-1].principal is ref for ref in refs])
+        arrays = [getattr(self.state, name) for name in RefereeState.DYNAMIC] + [games, principal]
+        return hashlib.sha1(b"".join(array.tobytes() for array in arrays)).hexdigest()
+
+    def move_game(self, game, day):
+        # the game is played on 'day' instead, before assigning its referees
+        if game.referees:
+            raise Exception("No se puede mover un partido con arbitros: {}".format(game.debug()))
+        self.games[game.day].remove(game)
+        if not self.games[game.day]:
+            del self.games[game.day]
+        game.date += datetime.timedelta(days=day - game.day)
+        game.day = day
+        if day >= self.occupancy.shape[1] - 1:  # after the end of the season
+            home = (self.state.home.astype(np.int32) << 2 | HOME)[:, None]
+            self.occupancy = np.hstack([self.occupancy] + [home] * (day + 2 - self.occupancy.shape[1]))
+        self.games.setdefault(day, []).append(game)
+
+        self.games = {d: sorted(self.games[d], key=lambda g: g.index) for d in sorted(self.games)}
 
     def pick_city(self, id, name):
         if name not in self.cities:
-            self.cities[name] = City(id, name)
+            city = self.cities[name] = City(id, name, len(self.cities))
+            self.city_names.setdefault(city.city_name, city)
         return self.cities[name]
 
+    def init_city_tables(self):
+        cities = list(self.cities.values())
+        self.flight_table = np.zeros((len(cities), len(cities)), dtype=np.int64)
+        self.distance_table = np.zeros((len(cities), len(cities)), dtype=np.int64)
+
+        for city in cities:
+            city.flights = CityTable(self.flight_table, city, cities)
+            city.distances = CityTable(self.distance_table, city, cities)
+
+    def read_city_table(self, file):
+        # reads a teams x teams csv into a matrix, returns it with the City.index of every row and column
+        with open(file) as csvfile:
+            lines = csv.reader(csvfile)
+            teams = next(lines)[1:]  # el header
+            rows = [line for line in lines]
+
+        values = np.array([[int(value) if value else 0 for value in line[1:]] for line in rows], dtype=np.int64)
+        from_cities = np.array([self.teams[line[0]].city.index for line in rows])
+        to_cities = np.array([self.teams[team].city.index for team in teams])
+        return values, from_cities, to_cities
+
+    def fill_city_table(self, table, values, from_cities, to_cities):
+        # teams sharing a city (LAC, LAL) keep the first row/column, as the old per cell loaders did
+        _, rows = np.unique(from_cities, return_index=True)
+        _, columns = np.unique(to_cities, return_index=True)
+        table[np.ix_(from_cities[rows], to_cities[columns])] = values[np.ix_(rows, columns)]
+
     def pick_channel(self, name):
         if name not in self.channels:
             self.channels[name] = Channel(name)
@@ -701,15 +1125,15 @@ class NBA:
         return self.teams[code]
 
     def pick_team_name(self, name):
-        for code in self.teams:
-            if self.teams[code].name == name:
-                return self.teams[code]
-        return False
+        return self.team_names.get(name, False)
 
     def add_game(self, game):
         if game.day not in self.games:
             self.games[game.day] = []
         self.games[game.day].append(game)
+
+        game.index = len(self.game_list)
+        self.game_list.append(game)
         return True
 
     def seed_locations(self, file):
@@ -719,6 +1143,7 @@ class NBA:
                 team = self.pick_team(line["CODE"])
 
                 team.name = line["TEAM"]
+                self.team_names.setdefault(team.name, team)
                 team.arena = line["ARENA"]
                 id = line["ID"]
                 city = self.pick_city(id, line["CITY"])
@@ -727,6 +1152,8 @@ class NBA:
                 team.set_city(city)
                 self.teams[line["CODE"]] = team
 
+        self.init_city_tables()
+
     def seed_games(self, file):
         with open(file) as csvfile:
             lines = csv.DictReader(csvfile)
@@ -739,11 +1166,8 @@ class NBA:
                 away = self.pick_team_name(line["AWAY"])
                 home = self.pick_team_name(line["HOME"])
 
-                date = datetime.datetime.strptime(line["DATE"], "%m/%d").date()
-                if date.month >= 10:
-                    date = date.replace(year=2018)
-                else:
-                    date = date.replace(year=2019)
+                month, day_of_month = (int(value) for value in line["DATE"].split("/"))  # %m/%d
+                date = datetime.date(2018 if month >= 10 else 2019, month, day_of_month)
 
                 day = int(line["DAY"])
 
@@ -751,38 +1175,23 @@ class NBA:
                 self.add_game(game)
 
     def seed_distances(self, file):
-        with open(file) as csvfile:
-            lines = csv.reader(csvfile)
-            teams = next(lines)[1:]  # el header
+        values, from_cities, to_cities = self.read_city_table(file)
 
-            for idx1, line in enumerate(lines):
-                team = line[0]
-                index_team = teams.index(team)
-                distances = line[index_team + 1:]
+        # upper triangle has the distances in miles (lower one is km), la copiamos simetrica
+        columns = {}  # {City.index: first column}
+        for column, city in enumerate(to_cities.tolist()):
+            columns.setdefault(city, column)
+        positions = np.array([columns[city] for city in from_cities.tolist()])
+        miles = np.where(positions[:, None] <= np.arange(len(to_cities))[None, :], values, 0)
+        miles_sym = np.zeros((len(to_cities), len(to_cities)), dtype=np.int64)
+        miles_sym[positions] = miles
+        miles_sym = np.maximum(miles_sym, miles_sym.T)
 
-                from_city = self.teams[team].city
-
-                for idx2, distance in enumerate(distances):
-                    to_city = self.teams[teams[idx1 + idx2]].city
-                    from_city.add_distance(to_city, distance)
+        self.fill_city_table(self.distance_table, miles_sym, to_cities, to_cities)
 
     def seed_flight_costs(self, file):
-        with open(file) as csvfile:
-            lines = csv.reader(csvfile)
-            teams = next(lines)[1:]  # el header
-
-            for line in lines:
-                team = line[0]
-                costs = line[1:]
-
-                from_city = self.teams[team].city
-
-                for idx1, cost in enumerate(costs):
-                    if cost == 0 or not cost:  # misma ciudad
-                        cost = 0
-
-                    to_city = self.teams[teams[idx1]].city
-                    from_city.add_flight(to_city, cost)
+        values, from_cities, to_cities = self.read_city_table(file)
+        self.fill_city_table(self.flight_table, values, from_cities, to_cities)
 
     def seed_referees(self, file):
         with open(file, encoding='utf-8-sig') as csvfile:
@@ -802,32 +1211,159 @@ class NBA:
                     city_name = "Washington".strip().lower()
                     city_state = "D.C."
 
-                translate = {"auburn hills": "detroit",  # esto esta por mientras
-                             "filadelfia": "philadelphia",
-                             "los ángeles": "los angeles",
-                             "nueva orleans": "new orleans",
-                             "indianápolis": "indianapolis",
-                             "nueva york": "new york"}
-
-                if city_name in translate:
-                    city_name = translate[city_name]
-
-                city_found = None
-                for i in self.cities.values():
-                    if i.city_name == city_name:
-                        city_found = i
-                        break
-
+                city_name = TRANSLATE_CITIES.get(city_name, city_name)
+                city_found = self.city_names.get(city_name)
                 if not city_found:
                     raise Exception("No es posible encontrar la ciudad '{}' para arbitro id '{}'".format(city, code))
 
                 referee = Referee(code, type, city_found, income, aditional_income)
+                referee.index = len(self.referees)
                 self.referees[code] = referee
 
+        self.init_referees()
+
+    def init_referees(self):
+        self.build_eligibility()
+        self.init_ledger()
+
+        self.state = RefereeState(list(self.referees.values()))
+        for ref in self.referees.values():
+            ref.nba = self
+            ref.state = self.state
+        self.init_occupancy()
+
+    def init_occupancy(self):
+        # a referee sent home is at home since the day after its last game (see Referee.move_home), so only
+        # the games and the days waiting for a game away are written
+        home = self.state.home.astype(np.int32) << 2 | HOME
+        self.occupancy = np.repeat(home[:, None], self.season_end + 1, axis=1)
+
+    def season_arrays(self):
+        # the seeds as arrays, to cache them (see load_nba): cities, teams, channels, games, the city tables and
+        # the referees, every object by its position
+        cities = list(self.cities.values())
+        teams = list(self.teams.values())
+        channels = list(self.channels)
+        team_index = {team: i for i, team in enumerate(teams)}
+        channel_index = {name: i for i, name in enumerate(channels)}
+        refs = list(self.referees.values())
+        return {"version": np.array(SEASON_CACHE_VERSION),
+                "city_id": np.array([city.id for city in cities], dtype=str),
+                "city_name": np.array([city.city for city in cities], dtype=str),
+                "city_hotel": np.array([city.hotel_cost for city in cities], dtype=np.int64),
+                "team_code": np.array([team.code for team in teams], dtype=str),
+                "team_name": np.array([team.name for team in teams], dtype=str),
+                "team_arena": np.array([team.arena for team in teams], dtype=str),
+                "team_city": np.array([team.city.index for team in teams], dtype=np.int32),
+                "channel_name": np.array(channels, dtype=str),
+                "game_home": np.array([team_index[game.home] for game in self.game_list], dtype=np.int32),
+                "game_away": np.array([team_index[game.away] for game in self.game_list], dtype=np.int32),
+                "game_date": np.array([game.date.toordinal() for game in self.game_list], dtype=np.int32),
+                "game_day": np.array([game.day for game in self.game_list], dtype=np.int32),
+                "game_channel": np.array([channel_index[game.channel.name] if game.channel else -1
+                                          for game in self.game_list], dtype=np.int32),
+                "flight_table": self.flight_table,
+                "distance_table": self.distance_table,
+                "referee_id": np.array([ref.id for ref in refs], dtype=str),
+                "referee_type": np.array([ref.type for ref in refs], dtype=str),
+                "referee_income": np.array([ref.income for ref in refs], dtype=np.int64),
+                "referee_aditional_income": np.array([ref.aditional_income for ref in refs], dtype=np.int64),
+                "referee_home": np.array([ref.home.index for ref in refs], dtype=np.int32)}
+
+    def seed_arrays(self, arrays):
+        # same objects the seed_* build, from season_arrays
+        if int(arrays["version"]) != SEASON_CACHE_VERSION:
+            raise Exception("Cache de temporada con version {}, se esperaba {}".format(int(arrays["version"]),
+                                                                                     SEASON_CACHE_VERSION))
+        cities = [self.pick_city(id, name) for id, name in zip(arrays["city_id"].tolist(),
+                                                               arrays["city_name"].tolist())]
+        for city, hotel_cost in zip(cities, arrays["city_hotel"].tolist()):
+            city.hotel_cost = hotel_cost
+
+        teams = []
+        for code, name, arena, city in zip(arrays["team_code"].tolist(), arrays["team_name"].tolist(),
+                                           arrays["team_arena"].tolist(), arrays["team_city"].tolist()):
+            team = self.pick_team(code)
+            team.name = name
+            self.team_names.setdefault(name, team)
+            team.arena = arena
+            team.set_city(cities[city])
+            teams.append(team)
+        self.init_city_tables()
+
+        channels = [self.pick_channel(name) for name in arrays["channel_name"].tolist()]
+        for home, away, date, day, channel in zip(arrays["game_home"].tolist(), arrays["game_away"].tolist(),
+                                                  arrays["game_date"].tolist(), arrays["game_day"].tolist(),
+                                                  arrays["game_channel"].tolist()):
+            game = Game(teams[home], teams[away], datetime.date.fromordinal(date), day,
+                        channels[channel] if channel >= 0 else None)
+            self.add_game(game)
+
+        self.flight_table[:] = arrays["flight_table"]
+        self.distance_table[:] = arrays["distance_table"]
+
+        for code, type, income, aditional_income, home in zip(arrays["referee_id"].tolist(),
+                                                              arrays["referee_type"].tolist(),
+                                                              arrays["referee_income"].tolist(),
+                                                              arrays["referee_aditional_income"].tolist(),
+                                                              arrays["referee_home"].tolist()):
+            referee = Referee(code, type, cities[home], income, aditional_income)
+            referee.index = len(self.referees)
+            self.referees[code] = referee
+        self.init_referees()
+
+    def init_ledger(self):
+        self.ledger = CostLedger(list(self.referees.values()), self.game_list)
+        for ref in self.referees.values():
+            ref.ledger = self.ledger
+        for game in self.game_list:
+            game.ledger = self.ledger
+
+    def build_eligibility(self):
+        # rules that never change during the season: a referee can't refer in the city where they live nor its team
+        refs_home = np.array([r.home.index for r in self.referees.values()])
+        games_home = np.array([game.home.city.index for game in self.game_list])
+        games_away = np.array([game.away.city.index for game in self.game_list])
+
+        self.eligibility = (refs_home[:, None] != games_home[None, :]) & (refs_home[:, None] != games_away[None, :])
+
+    def day_eligibility(self, day):
+        # referees x games of the day
+        return self.eligibility[:, [game.index for game in self.games[day]]]
+
+    def cost_matrix(self, games):
+        # referees x games matrix with the cost of sending each referee to each game: flight from the current city
+        # (or home), hotel and aditional_income of the days waiting there and of the game, and the flight back home
+        # instead of the one from the current city
+        current = self.state.city
+        home = self.state.home
+        aditional_income = self.state.aditional_income
+        hotel = np.array([city.hotel_cost for city in self.cities.values()], dtype=np.int64)
+
+        game_city = np.array([game.home.city.index for game in games], dtype=np.int64)
+        day = np.array([game.day for game in games], dtype=np.int64)
+
+        days_waiting = np.where((current == home)[:, None], 0, day[None, :] - self.state.last_day[:, None] - 1)
+
+        flights = self.flight_table
+        flight_home = np.where(current == home, 0, flights[current, home])
+        return flights[current[:, None], game_city[None, :]] + hotel[game_city][None, :] + \
+            flights[game_city[None, :], home[:, None]] - flight_home[:, None] + \
+            (hotel[current] + aditional_income)[:, None] * days_waiting + aditional_income[:, None]
+
+    def rank_referees(self, games, costs=None):
+        # for every game a list of [Referee, cost] sorted by cost (ties keep the referees order)
+        refs = list(self.referees.values())
+        if costs is None:
+            costs = self.cost_matrix(games)
+        order = np.argsort(costs, axis=0, kind="stable")
+        ranked = np.take_along_axis(costs, order, axis=0)
+
+        return [[[refs[r], cost] for r, cost in zip(order[:, j].tolist(), ranked[:, j].tolist())]
+                for j in range(len(games))]
+
     def order_costs(self, game):
-        refs = [[r, r.cost_to_game(game, self)] for r in self.referees.values()]
-        refs.sort(key=lambda x: x[1], reverse=False)
-        return refs
+        return self.rank_referees([game])[0]
 
     def make_timeline(self):
         refs = [r for r in self.referees.values()]
@@ -852,7 +1388,8 @@ class NBA:
             if game.referees:
                 raise Exception("Error. Esto hay que hacerlo cuando no hay ningun referee asignado")
 
-            game.valid_referees = self.order_costs(game)
+        for game, refs in zip(self.games[day], self.rank_referees(self.games[day])):
+            game.valid_referees = refs
 
 
 def export():
@@ -877,6 +1414,10 @@ class Backtrack:
     def __init__(self, nba):
         self.nba = nba
         self.list_game_options = {}  # dict with {game: [options]}
+        self.checkpoint_days = set()  # days to save a checkpoint when the search gets to them
+        self.checkpoint_file = "resultados/checkpoint-{}.npz"  # formatted with the day
+        self.until = None  # function(day), the search stops (returning True) at the start of a day where it's True
+        self.eligible = {}  # dict with {[DATE] = [[NBA.eligibility of each referee] for each game of the day]}
 
     def day_valid(self, day):
         for game in self.nba.games[day]:
@@ -931,11 +1472,12 @@ class Backtrack:
         if day not in self.nba.games or num_game > len(nba.games[day]):  # SOME DAYS DON'T HAVE GAMES
             print("Day don't have games or limit reached")
             # update refs
+            mark = self.nba.trail.mark()
             self.nba.update_all_refs()
             if self.run(day + 1, 1):
                 return True
             else:
-                self.nba.revert_all_refs()
+                self.nba.trail.undo(mark)
                 return False
         else:
             game = nba.games[day][num_game - 1]
@@ -977,14 +1519,18 @@ class Backtrack:
     def next_referee_to_asign(self, day, principal=False):
         games_day = self.nba.games[day]
         result = []  # [game, referee, cost]
-        for game in games_day:
+        scanned = 0  # referees looked at, for the metrics
+        if day not in self.eligible:  # the eligibility doesn't change during the search, built once per day
+            self.eligible[day] = self.nba.day_eligibility(day).T.tolist()
+        for game, game_eligible in zip(games_day, self.eligible[day]):
             found = False
             original = None
             if not game.has_all_refs():
                 if not principal or (principal and len(game.referees) == 0):  # si buscamos un principal
                     for i in range(game.i_valid_referees, len(game.valid_referees)):
                         referee, cost = game.valid_referees[i]
-                        if referee.is_valid(game):
+                        scanned += 1
+                        if game_eligible[referee.index] and referee.is_available(game):
                             if principal and not ("principal" in referee.type and referee.can_be_principal(game)):
                                 continue  # saltamos hasta encontrar principal
                             result.append([game, referee, cost])
@@ -996,12 +1542,14 @@ class Backtrack:
                     if not found:
                         raise Exception("No se pudo encontrar un referee")
 
+                    rango_de_escoger_arbitros = self.nba.config.rango_de_escoger_arbitros
                     if rango_de_escoger_arbitros > 1.00:  # if heuristica
                         for i in range(game.i_valid_referees, len(game.valid_referees)):
                             referee, cost = game.valid_referees[i]
+                            scanned += 1
                             if cost > original[2] * rango_de_escoger_arbitros:  # rango_de_escoger_arbitros% mas
                                 break
-                            if referee.is_valid(game) and len(referee.refgames) == 0:
+                            if game_eligible[referee.index] and referee.is_available(game) and len(referee.refgames) == 0:
                                 if principal and not ("principal" in referee.type and referee.can_be_principal(game)):
                                     continue  # saltamos hasta encontrar principal
                                 result.remove(original)
@@ -1009,24 +1557,13 @@ class Backtrack:
                                 game.i_valid_referees = i
                                 break
 
+        if self.nba.metrics is not None:
+            self.nba.metrics.candidates[day] += scanned
+
         result.sort(key=lambda x: x[2], reverse=False)
         return result
 
-    def run(self, day):
-        global assigned, reused
-        # print("day {}".format(day))
-        if day >= 178:  # 178: END CONDITION
-            for ref in nba.referees.values():
-                if ref.current_city != ref.home:
-                    ref.days_away += 1  # for stats
-                    ref.move_home(day)
-
-            return True
-
-        if day not in nba.games:  # SOME DAYS DON'T HAVE GAMES
-            self.nba.update_all_refs(day)
-            return self.run(day + 1)
-
+    def day_frame(self, day):
         if not self.nba.valid_refs_per_game_done(day):
             self.nba.update_valid_refs_per_game(day)
 
@@ -1039,10 +1576,34 @@ class Backtrack:
                 break
         # print(refs)
 
-        for game, ref, cost in refs:
-            if ref.is_valid(game):
+        return [day, refs, 0, None]  # [day, candidates, next candidate, choice taken]
+
+    def advance(self, frame):
+        # undoes the choice taken by the frame (if any) and takes the next valid one.
+        # returns the day the search continues on, or None if the frame is exhausted
+        stats = self.nba.stats
+        day, refs, i, choice = frame
+
+        if choice:
+            game, ref, mark = choice
+            if mark is not None:  # the choice completed the day, we revert the day transition
+                self.nba.trail.undo(mark)
+
+            stats.assigned -= 1
+            # print("undo")
+            ref.undo_assign_game(game)
+            if ref.refgames and ref.current_city != ref.home:  # same state as when it was assigned
+                stats.reused -= 1
+            frame[3] = None
+            if self.nba.metrics is not None:
+                self.nba.metrics.undos[day] += 1
+
+        while i < len(refs):
+            game, ref, cost = refs[i]
+            i += 1
+            if ref.is_available(game):  # next_referee_to_asign only gives eligible referees
                 if ref.refgames and ref.current_city != ref.home:
-                    reused += 1
+                    stats.reused += 1
                     # print(game.day - ref.refgames[-1].day)
 
                 better_before = ref.better_before(game)
@@ -1057,211 +1618,430 @@ class Backtrack:
 
                 ref.assign_game(game)  # IF VALID: ASSIGN
                 # print("assigned")
-                assigned += 1
+                stats.assigned += 1
+                if self.nba.metrics is not None:
+                    self.nba.metrics.assignments[day] += 1
+                frame[2] = i
 
                 if not self.day_valid(day):
-                    if self.run(day):  # STAY ON THIS DAY and GAME
-                        return True
-                else:
-                    for nba_game in self.nba.games[day]:
-                        nba_game.set_refs_types()  # cuando tenemos todos los refs, asignamos tipos
+                    frame[3] = [game, ref, None]
+                    return day  # STAY ON THIS DAY and GAME
 
-                    self.nba.update_all_refs(day)
+                mark = self.nba.trail.mark()
+                for nba_game in self.nba.games[day]:
+                    nba_game.set_refs_types()  # cuando tenemos todos los refs, asignamos tipos
+                    self.nba.trail.push(nba_game.clear_refs_types)
 
-                    if self.run(day + 1):  # GO TO NEXT DAY
-                        return True
-
-                    self.nba.update_all_refs(day)
-                    # return False
-
-                assigned -= 1
-                # print("undo")
-                ref.undo_assign_game(game)
-        return False
+                self.nba.update_all_refs(day)
+                frame[3] = [game, ref, mark]
+                return day + 1  # GO TO NEXT DAY
 
+        frame[2] = i
+        return None
 
-def export_game_days(nba, pprint=False):
-    season_total_cost = 0
-    with open("resultados/games-days.txt", "w") as day_games:
-        for i in range(1, 178):
-            if i in nba.games:
-                day_str = "{0} DAY {1} {0}\n".format("-" * 15, i)
-                if pprint:
-                    print(day_str, end="")
-                day_games.write(day_str)
-
-                for g, game in enumerate(nba.games[i]):
-                    if not game.referees:
-                        return
-
-                    refs = [r.id for r in game.referees]
-
-                    string = "Game {}: {}; Channel: {}; Valid refs: {}, Total cost: {}, Costs:\n" \
-                             "{}\n\n".format(g + 1, refs, game.channel and game.channel.name, game.valid_referees,
-                                             game.total_cost, game.costs_pretty)
-                    season_total_cost += game.total_cost
+    def run(self, day):
+        metrics = self.nba.metrics
+        if metrics is not None and metrics.profile:
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(self.search, day)
+            finally:
+                profiler.dump_stats(metrics.profile)
+        return self.search(day)
+
+    def resume(self, file):
+        # goes on with the search from a checkpoint saved by run, up to the same schedule of a run from day 1.
+        # The assignments before the checkpoint are fixed: if the search would go back before its day there's
+        # nothing to undo and it returns False
+        snapshot = SeasonSnapshot.load(file)
+        self.nba.restore(snapshot)
+        return self.run(int(snapshot.day))
+
+    def search(self, day):
+        # same decisions as a recursive search, but driven from an explicit stack of
+        # frames (one per assignment) so the season length doesn't hit the recursion limit
+        metrics = self.nba.metrics
+        stack = []
+        previous_day = None  # the search stays on a day for each of its assignments
+        while True:
+            # print("day {}".format(day))
+            if day in self.checkpoint_days and day != previous_day:  # at the start of the day
+                self.nba.snapshot(day).save(self.checkpoint_file.format(day), compressed=True)
+            if self.until is not None and day != previous_day and self.until(day):
+                return True
+            previous_day = day
 
-                    if pprint:
-                        print(string, end="")
-                    day_games.write(string)
+            if day >= self.nba.season_end:  # END CONDITION
+                self.nba.finish_season(day)
+                return True
 
-        string = "Season total cost: {}\n".format(season_total_cost)
-        if pprint:
-            print(string, end="")
-        day_games.write(string)
+            if day not in self.nba.games:  # SOME DAYS DON'T HAVE GAMES
+                self.nba.update_all_refs(day)
+                day += 1
+                continue
 
+            start = time.perf_counter()
+            stack.append(self.day_frame(day))
 
-def export_game_days_csv(nba):
-    with open("resultados/games-days-csv.csv", "w") as csvfile:
+            next_day = None
+            while stack and next_day is None:
+                next_day = self.advance(stack[-1])
+                if next_day is None:
+                    stack.pop()  # no more options, back to the previous assignment
 
-        fieldnames = ['Game ID', 'Day', 'Channel', '#Valid refs', 'Total cost']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+            if metrics is not None:
+                metrics.max_depth[day] = max(metrics.max_depth[day], len(stack))
+                metrics.seconds[day] += time.perf_counter() - start
 
-        for i in range(1, 178):
-            if i in nba.games:
-                for g, game in enumerate(nba.games[i]):
-                    if not game.referees:
-                        return
-                    write = {"Game ID": g + 1,
-                             "Day": i,
-                             "Channel": game.channel and game.channel.name,
-                             "#Valid refs": game.valid_referees,
-                             "Total cost": game.total_cost}
-                    # print(write)
-                    writer.writerow(write)
-
-
-def export_refs_info(nba, pprint=False):
-    refs = [r for r in nba.referees.values()]
-    refs.sort(key=lambda x: len(set(x.timeline)), reverse=False)
-    season_total_cost = 0
-    with open("resultados/refs-info.txt", "w") as refs_info:
-        for ref in refs:
-            string = "ID: {0.id}\n" \
-                     "Home: {0.home.city_name}\n" \
-                     "Aditional income: {0.aditional_income}\n" \
-                     "Dif Cities: {1}\n" \
-                     "Dif Games: {4}\n" \
-                     "Cities: {2}\n" \
-                     "Total Cost: {0.total_cost}\n" \
-                     "Average cost (dividido en numero de games): {3}\n" \
-                     "Costs:\n" \
-                     "{0.costs_pretty}\n\n".format(ref,
-                                                   len(set(ref.timeline)),
-                                                   set(map(lambda x: x.city, ref.timeline)),
-                                                   ref.total_cost / len(ref.refgames) if ref.refgames else "-",
-                                                   len(set(ref.refgames)))
-            season_total_cost += ref.total_cost
-            if pprint:
+            if next_day is None:
+                return False
+            day = next_day
+
+
+EXPORT_FORMATS = ["games-days", "games-days-csv", "refs-info", "refs-info-csv", "history", "jsonl"]
+EXPORT_FILES = {"games-days": "games-days.txt",
+                "games-days-csv": "games-days-csv.csv",
+                "refs-info": "refs-info.txt",
+                "refs-info-csv": "refs-info-csv.csv",
+                "history": "history.csv",
+                "jsonl": "season.jsonl"}  # a json per line, the games and then the referees
+EXPORT_BUFFER = 1 << 16  # bytes of each file buffer
+
+
+def pretty_costs(costs, key):
+    # same text as Game.costs_pretty and Referee.costs_pretty, with 'key' the dict key of each Referee or Game
+    pp = pprint.PrettyPrinter(indent=4)
+    return pp.pformat({key(producer): desc for producer, desc in costs.items()})
+
+
+def export_all(nba, formats=EXPORT_FORMATS[:-1], compact=False, pprint=False, folder="resultados"):
+    # writes every format of 'formats' (see EXPORT_FORMATS) with one pass over the games and one over the
+    # referees, the costs of each one taken once from the ledger. With 'compact' the games have how many valid
+    # referees they had instead of the whole list
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise Exception("Formatos de export desconocidos: {}".format(sorted(unknown)))
+    ledger = nba.ledger
+    money = ledger.game_totals * MONEY
+
+    with ExitStack() as stack:
+        files = {name: stack.enter_context(open("{}/{}".format(folder, EXPORT_FILES[name]), "w",
+                                                buffering=EXPORT_BUFFER))
+                 for name in EXPORT_FORMATS if name in formats}
+        games_days = files.get("games-days")
+        games_days_csv = files.get("games-days-csv")
+        refs_info = files.get("refs-info")
+        refs_info_csv = files.get("refs-info-csv")
+        history = files.get("history")
+        jsonl = files.get("jsonl")
+
+        def write(file, string, echo):
+            file.write(string)
+            if echo:
                 print(string, end="")
-            refs_info.write(string)
-
-        string = "Season total cost: {}\n".format(season_total_cost)
-        if pprint:
-            print(string, end="")
-        refs_info.write(string)
 
+        if games_days or games_days_csv or jsonl:
+            game_rows = ledger.groups("game")
+            if games_days_csv:
+                games_writer = csv.DictWriter(games_days_csv, fieldnames=['Game ID', 'Day', 'Channel', '#Valid refs',
+                                                                          'Total cost'])
+                games_writer.writeheader()
+
+            season_total_cost = 0
+            complete = True
+            for i in range(1, nba.season_end):
+                if i not in nba.games:
+                    continue
+                if games_days:
+                    write(games_days, "{0} DAY {1} {0}\n".format("-" * 15, i), pprint)
 
-def export_refs_info_csv(nba):
-    refs = [r for r in nba.referees.values()]
-    refs.sort(key=lambda x: len(set(x.timeline)), reverse=False)
-    with open("resultados/refs-info-csv.csv", "w") as csvfile:
-        fieldnames = ['Ref ID', 'Home', 'Aditional Income', '#Cities', '#Games', 'Avg cost', 'Total cost']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for ref in refs:
-            write = {"Ref ID": ref.id,
-                     "Home": ref.home.city_name,
-                     "Aditional Income": ref.aditional_income,
-                     "#Cities": len(set(ref.timeline)),
-                     "#Games": len(set(ref.refgames)),
-                     "Avg cost": round(ref.total_cost / len(ref.refgames), 2) if ref.refgames else 0,
-                     "Total cost": ref.total_cost}
-            writer.writerow(write)
-
-
-def create_history(nba):
-    with open("resultados/history.csv", "w") as csvfile:
-
-        fieldnames = ['Ref ID', 'Type'] + [i for i in range(1, 178)]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for id, ref in nba.referees.items():
-            write = {"Ref ID": id,
-                     "Type": ref.type}
-
-            i_game = 0
-            home = True
-            for day in range(1, 178):
-                value = ""
-                if i_game < len(ref.refgames) and day == ref.refgames[i_game].day:
-                    # value = "game"
-                    value = "{} - {}".format(ref.refgames[i_game].home.city.city_name,
-                                             ref.refgames[i_game].ref_type(ref))
-                    i_game += 1
-
-                if i_game < len(ref.refgames):
-                    dif = ref.refgames[i_game].day - ref.refgames[i_game - 1].day
-                    if 1 < dif <= 3 and day > ref.refgames[i_game - 1].day:
-                        value = "waiting"
-
-                write[day] = value
-
-            writer.writerow(write)
-
+                for g, game in enumerate(nba.games[i]):
+                    if not game.referees:  # the season isn't solved from here on
+                        complete = False
+                        break
 
-def days_out_stats(pprint=False):
-    global asigned, reused, sum_days_away, count_days_away, count_one_days_away, count_fourplus_days_away, count_seven_days_away
+                    total_cost = int(money[game.index].sum())
+                    season_total_cost += total_cost
+                    if compact:
+                        valid_referees = len(game.valid_referees) if game.valid_referees else 0
+                    else:
+                        valid_referees = str(game.valid_referees)  # the repr of every Referee, once for both files
+                    channel = game.channel and game.channel.name
+
+                    if games_days:
+                        costs = ledger.costs(game=game, rows=game_rows[game.index])
+                        write(games_days, "Game {}: {}; Channel: {}; Valid refs: {}, Total cost: {}, Costs:\n"
+                                          "{}\n\n".format(g + 1, [r.id for r in game.referees], channel, valid_referees,
+                                                          total_cost, pretty_costs(costs, lambda ref: ref.id)), pprint)
+                    if games_days_csv:
+                        games_writer.writerow({"Game ID": g + 1,
+                                               "Day": i,
+                                               "Channel": channel,
+                                               "#Valid refs": valid_referees,
+                                               "Total cost": total_cost})
+                    if jsonl:
+                        record = {"record": "game",
+                                  "index": game.index,
+                                  "day": i,
+                                  "date": game.date.isoformat(),
+                                  "home": game.home.code,
+                                  "away": game.away.code,
+                                  "channel": channel,
+                                  "principal": game.principal and game.principal.id,
+                                  "colaboradores": [ref.id for ref in game.colaboradores],
+                                  "total_cost": total_cost,
+                                  "costs": dict(zip(COST_CATEGORIES, ledger.game_totals[game.index].tolist()))}
+                        if not compact:
+                            record["valid_referees"] = [[ref.id, cost] for ref, cost in game.valid_referees or []]
+                        jsonl.write(json.dumps(record) + "\n")
+                if not complete:
+                    break
+
+            if games_days and complete:
+                write(games_days, "Season total cost: {}\n".format(season_total_cost), pprint)
+
+        if refs_info or refs_info_csv or history or jsonl:
+            ref_rows = ledger.groups("referee")
+            totals = (ledger.referee_totals * MONEY).sum(axis=1).tolist()
+            if refs_info_csv:
+                refs_writer = csv.DictWriter(refs_info_csv, fieldnames=['Ref ID', 'Home', 'Aditional Income',
+                                                                        '#Cities', '#Games', 'Avg cost', 'Total cost'])
+                refs_writer.writeheader()
+            if history:
+                history_writer = csv.writer(history)
+                history_writer.writerow(['Ref ID', 'Type'] + [i for i in range(1, nba.season_end)])
+
+            refs = list(nba.referees.values())
+            season_total_cost = 0
+            for ref in sorted(refs, key=lambda x: len(set(x.timeline))):  # the order of the refs info files
+                total_cost = totals[ref.index]
+                season_total_cost += total_cost
+                if refs_info:
+                    costs = ledger.costs(referee=ref, rows=ref_rows[ref.index])
+                    write(refs_info, "ID: {0.id}\n"
+                                     "Home: {0.home.city_name}\n"
+                                     "Aditional income: {0.aditional_income}\n"
+                                     "Dif Cities: {1}\n"
+                                     "Dif Games: {4}\n"
+                                     "Cities: {2}\n"
+                                     "Total Cost: {5}\n"
+                                     "Average cost (dividido en numero de games): {3}\n"
+                                     "Costs:\n"
+                                     "{6}\n\n".format(ref,
+                                                      len(set(ref.timeline)),
+                                                      set(map(lambda x: x.city, ref.timeline)),
+                                                      total_cost / len(ref.refgames) if ref.refgames else "-",
+                                                      len(set(ref.refgames)),
+                                                      total_cost,
+                                                      pretty_costs(costs, lambda game: game.day)), pprint)
+                if refs_info_csv:
+                    refs_writer.writerow({"Ref ID": ref.id,
+                                          "Home": ref.home.city_name,
+                                          "Aditional Income": ref.aditional_income,
+                                          "#Cities": len(set(ref.timeline)),
+                                          "#Games": len(set(ref.refgames)),
+                                          "Avg cost": round(total_cost / len(ref.refgames), 2) if ref.refgames else 0,
+                                          "Total cost": total_cost})
+            if refs_info:
+                write(refs_info, "Season total cost: {}\n".format(season_total_cost), pprint)
+
+            if history:
+                # every code of NBA.occupancy as text, the rows are the codes of each referee
+                labels = np.array([label for city in nba.cities.values()
+                                   for label in ["", "waiting", "{} - principal".format(city.city_name),
+                                                 "{} - colaborador".format(city.city_name)]], dtype=object)
+                days = labels[nba.occupancy[:, 1:nba.season_end]].tolist()
+
+            for id, ref in nba.referees.items():  # the order of the seeds
+                if history:
+                    history_writer.writerow([id, ref.type] + days[ref.index])
+                if jsonl:
+                    jsonl.write(json.dumps({"record": "referee",
+                                            "id": id,
+                                            "type": ref.type,
+                                            "home": ref.home.city,
+                                            "aditional_income": ref.aditional_income,
+                                            "games": [game.index for game in ref.refgames],
+                                            "total_cost": totals[ref.index],
+                                            "costs": dict(zip(COST_CATEGORIES,
+                                                              ledger.referee_totals[ref.index].tolist()))}) + "\n")
+
+
+def export_game_days(nba, pprint=False, folder="resultados", compact=False):
+    export_all(nba, ["games-days"], compact, pprint, folder)
+
+
+def export_game_days_csv(nba, folder="resultados", compact=False):
+    export_all(nba, ["games-days-csv"], compact, folder=folder)
+
+
+def export_refs_info(nba, pprint=False, folder="resultados"):
+    export_all(nba, ["refs-info"], pprint=pprint, folder=folder)
+
+
+def export_refs_info_csv(nba, folder="resultados"):
+    export_all(nba, ["refs-info-csv"], folder=folder)
+
+
+def create_history(nba, folder="resultados"):
+    export_all(nba, ["history"], folder=folder)
+
+
+def days_out_stats(nba, pprint=False, folder="resultados"):
+    stats = nba.stats
     string = "--- Stats ---\n" \
              "Asigned: {}; Resued {}\n" \
              "Ratio reused: {}\n" \
              "Avg days out {}\n" \
              "Times one day out {}\n" \
              "Times four+ days out {}\n" \
-             "Times seven days out {}\n".format(assigned, reused,
-                                                reused / assigned,
-                                                sum_days_away / count_days_away,
-                                                count_days_away,
-                                                count_one_days_away,
-                                                count_fourplus_days_away,
-                                                count_seven_days_away)
-    with open("resultados/stats.txt", "w") as file:
+             "Times seven days out {}\n".format(stats.assigned, stats.reused,
+                                                stats.reused / stats.assigned,
+                                                stats.sum_days_away / stats.count_days_away,
+                                                stats.count_days_away,
+                                                stats.count_one_days_away,
+                                                stats.count_fourplus_days_away,
+                                                stats.count_seven_days_away)
+    with open("{}/stats.txt".format(folder), "w") as file:
         file.write(string)
         if pprint:
             print(string)
 
 
+class PlainObject:  # same attributes with a __dict__, to compare against the slotted classes
+    pass
+
+
+def object_size(obj, containers, slots=True):
+    # bytes of the object plus the containers it owns. Without slots it measures the equivalent object with a
+    # __dict__ and lists, as the classes were before
+    if slots:
+        return sys.getsizeof(obj) + sum(sys.getsizeof(getattr(obj, name)) for name in containers)
+
+    plain = PlainObject()
+    for name in type(obj).__slots__:
+        setattr(plain, name, getattr(obj, name, None))
+    return sys.getsizeof(plain) + sys.getsizeof(plain.__dict__) + \
+           sum(sys.getsizeof(list(getattr(obj, name))) for name in containers)
+
+
+def memory_report(nba, pprint=False, folder="resultados"):
+    classes = [("City", list(nba.cities.values()), ["referees"]),
+               ("Team", list(nba.teams.values()), ["games"]),
+               ("Channel", list(nba.channels.values()), ["games"]),
+               ("Game", nba.game_list, ["referees", "colaboradores"]),
+               ("Referee", list(nba.referees.values()), ["refgames", "timeline", "cost_marks"])]
+
+    rows = []
+    for name, objects, containers in classes:
+        if not objects:
+            continue
+        slotted = sum(object_size(obj, containers) for obj in objects)
+        with_dict = sum(object_size(obj, containers, slots=False) for obj in objects)
+        rows.append([name, len(objects), round(slotted / len(objects), 1), round(with_dict / len(objects), 1),
+                     "{:.1f}%".format(100 * (1 - slotted / with_dict))])
+
+    ledger = sum(column.nbytes for column in nba.ledger.columns)
+    string = "--- Memory per object (bytes) ---\n" \
+             "{}\n" \
+             "Cost ledger: {} rows, {} bytes\n".format(tabulate(rows, headers=["Class", "Objects", "Slots",
+                                                                              "With __dict__", "Saved"]),
+                                                      nba.ledger.size, ledger)
+    with open("{}/memory.txt".format(folder), "w") as file:
+        file.write(string)
+        if pprint:
+            print(string)
+
+
+def load_report(nba, pprint=False, folder="resultados"):
+    rows = [[loader, round(seconds * 1000, 3)] for loader, seconds in nba.load_times.items()]
+    rows.append(["total", round(sum(nba.load_times.values()) * 1000, 3)])
+    string = "--- Load times ---\n" \
+             "{}\n".format(tabulate(rows, headers=["Loader", "ms"]))
+    with open("{}/load_times.txt".format(folder), "w") as file:
+        file.write(string)
+        if pprint:
+            print(string)
+
+
+def season_hash(folder):
+    # sha256 of the contents of the csv of the season, it changes if any of them changes
+    digest = hashlib.sha256(str(SEASON_CACHE_VERSION).encode())
+    for _, file in SEASON_FILES:
+        with open("{}/{}".format(folder, file), "rb") as csvfile:
+            digest.update(hashlib.sha256(csvfile.read()).digest())
+    return digest.hexdigest()
+
+
+def load_nba(folder="datos", config=None, cache=True):
+    # with 'cache' the seeds are saved in folder/SEASON_CACHE with the hash of the csv, and the next runs
+    # load the arrays from there while the csv stay the same
+    nba = NBA(config)
+    file = "{}/{}".format(folder, SEASON_CACHE)
+    if cache:
+        start = time.perf_counter()
+        key = season_hash(folder)
+        nba.load_times["season_hash"] = time.perf_counter() - start
+
+    if cache and os.path.exists(file):
+        start = time.perf_counter()
+        try:
+            with np.load(file) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except Exception:  # cache a medio escribir, se leen los csv
+            arrays = {}
+        if "hash" in arrays and str(arrays["hash"]) == key:
+            nba.seed_arrays(arrays)
+            nba.load_times["seed_arrays"] = time.perf_counter() - start
+            return nba
+
+    for loader, file_name in SEASON_FILES:
+        start = time.perf_counter()
+        getattr(nba, loader)("{}/{}".format(folder, file_name))
+        nba.load_times[loader] = time.perf_counter() - start
+
+    if cache:
+        start = time.perf_counter()
+        temporary = "{}.{}".format(file, os.getpid())  # other processes may be reading it (sweep.py)
+        try:
+            with open(temporary, "wb") as npz:
+                np.savez(npz, hash=np.array(key), **nba.season_arrays())
+            os.replace(temporary, file)
+        except OSError:  # read only folder or full disk, next time the csv are read again
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        nba.load_times["save_cache"] = time.perf_counter() - start
+    return nba
+
+
 if __name__ == "__main__":
-    nba = NBA()
+    config = SolverConfig()
+    # config.maximo_de_partidos = 40
+    # config.rango_de_escoger_arbitros = 1.05
 
     print("Cargando seeds")
-    nba.seed_locations("datos/locations.csv")
-    nba.seed_games("datos/games.csv")
-    nba.seed_distances("datos/distances (mi & km).csv")
-    nba.seed_flight_costs("datos/flight costs.csv")
-    nba.seed_referees("datos/referees.csv")
+    nba = load_nba("datos", config)
     print("Seeds terminado")
+    nba.metrics = SolverMetrics(nba.season_end + 1)
+    # nba.metrics.profile = "resultados/backtrack.prof"
 
     bk = Backtrack(nba)
+    # bk.checkpoint_days = {60, 120}  # deja resultados/checkpoint-60.npz y resultados/checkpoint-120.npz
     # bk.game_options(2, 2, limit=30)
 
     # pp = pprint.PrettyPrinter(indent=4)
     # print(pp.pformat(bk.list_game_options))
 
-    # maximo_de_partidos = 40
-    # rango_de_escoger_arbitros = 1.05
-
     bk.run(1)
-
-    export_game_days(nba)
-    # export_game_days(nba, pprint=True)
-    export_game_days_csv(nba)
-    export_refs_info(nba)
-    # export_refs_info(nba, pprint=True)
-    export_refs_info_csv(nba)
-    create_history(nba)
-    days_out_stats()
-    # days_out_stats(pprint=True)
+    # bk.resume("resultados/checkpoint-120.npz")  # en vez de bk.run(1), sigue desde el dia 120
+
+    export_all(nba, EXPORT_FORMATS)
+    # export_all(nba, EXPORT_FORMATS, pprint=True)
+    # export_all(nba, EXPORT_FORMATS, compact=True)  # sin las listas de arbitros validos de cada partido
+    days_out_stats(nba)
+    # days_out_stats(nba, pprint=True)
+    memory_report(nba)
+    # memory_report(nba, pprint=True)
+    load_report(nba)
+    # load_report(nba, pprint=True)
+    nba.metrics.write_jsonl("resultados/metrics.jsonl")
@@ -0,0 +1,117 @@
+import argparse
+import csv
+import datetime
+import io
+import math
+import os
+import random
+
+# canales de los partidos que no son ESPN, con su proporcion en la temporada 2018-2019 ('X': sin canal)
+CHANNELS = {"X": 0.833, "NBA TV": 0.093, "TNT": 0.058, "ABC": 0.016}
+REFEREE_TYPES = {"Principal y Colaborador": 0.50, "Colaborador": 0.33, "Principal": 0.17}
+SEASON_START = datetime.date(2018, 10, 16)  # day 1
+# load_nba takes the year from the month (2018 from october, 2019 before), so the season ends on 2019-09-30
+MAX_DAYS = (datetime.date(2019, 9, 30) - SEASON_START).days + 1
+
+
+def write_csv(file, rows, bom=False):
+    # same format as the files in 'datos': CRLF and no line break after the last row
+    text = io.StringIO()
+    csv.writer(text, lineterminator="\r\n").writerows(rows)
+    with open(file, "w", encoding="utf-8-sig" if bom else "utf-8", newline="") as csvfile:
+        csvfile.write(text.getvalue()[:-2])
+
+
+def generate(folder, teams=30, cities=None, referees=121, days=177, games_per_team=82, espn_share=0.07, seed=0):
+    # writes a league with the 5 files that load_nba reads. 'cities' <= 'teams', the teams left share cities
+    if days > MAX_DAYS:
+        raise Exception("La temporada puede tener a lo mas {} dias (hasta el 30/9/2019)".format(MAX_DAYS))
+    rng = random.Random(seed)
+    cities = cities or teams
+    os.makedirs(folder, exist_ok=True)
+
+    # ciudades en un plano de 2800 x 1500 millas, cada una con su hotel
+    points = [(rng.uniform(0, 2800), rng.uniform(0, 1500)) for _ in range(cities)]
+    hotels = [rng.randint(70, 300) for _ in range(cities)]
+    team_city = [t if t < cities else rng.randrange(cities) for t in range(teams)]
+    codes = ["T{:03d}".format(t + 1) for t in range(teams)]
+    names = ["Team {}".format(t + 1) for t in range(teams)]
+
+    write_csv("{}/locations.csv".format(folder),
+              [["ID", "TEAM", "CODE", "ARENA", "CITY", "HOTEL COST"]] +
+              [[t + 1, names[t], codes[t], "Arena {}".format(t + 1),
+                "City {0}, State {0}".format(team_city[t] + 1), hotels[team_city[t]]] for t in range(teams)])
+
+    # distancias: millas sobre la diagonal y km bajo ella; vuelos con un costo fijo, uno por milla y algo de ruido
+    miles = [[round(math.dist(points[a], points[b])) for b in range(cities)] for a in range(cities)]
+    fares = [[round(60 + 0.08 * miles[a][b] * rng.uniform(0.7, 1.5)) for b in range(cities)] for a in range(cities)]
+    distances, flights = [[""] + codes], [[""] + codes]
+    for t1 in range(teams):
+        distance_row, flight_row = [codes[t1]], [codes[t1]]
+        for t2 in range(teams):
+            a, b = team_city[t1], team_city[t2]
+            if t1 == t2:
+                distance_row.append("")
+                flight_row.append("")
+            else:
+                distance_row.append(miles[a][b] if t1 < t2 else round(miles[a][b] * 1.609))
+                flight_row.append(fares[a][b] if a != b else "")
+        distances.append(distance_row)
+        flights.append(flight_row)
+    write_csv("{}/distances (mi & km).csv".format(folder), distances)
+    write_csv("{}/flight costs.csv".format(folder), flights)
+
+    # partidos: cada equipo juega a lo mas uno por dia
+    playing = [set() for _ in range(days + 1)]  # teams playing each day
+    games = []
+    for _ in range(teams * games_per_team // 2):
+        home, away = rng.sample(range(teams), 2)
+        for _ in range(100):
+            day = rng.randint(1, days)
+            if home not in playing[day] and away not in playing[day]:
+                break
+        else:  # the season is almost full: a day free for the home team with any away team free that day
+            options = [(day, team) for day in range(1, days + 1) if home not in playing[day]
+                       for team in range(teams) if team != home and team not in playing[day]]
+            if not options:
+                raise Exception("No caben {} partidos por equipo en {} dias (se pusieron {} de {}), use mas dias o "
+                                "menos partidos por equipo".format(games_per_team, days, len(games),
+                                                                   teams * games_per_team // 2))
+            day, away = rng.choice(options)
+        playing[day].update((home, away))
+        if rng.random() < espn_share:
+            channel = "ESPN"
+        else:
+            channel = rng.choices(list(CHANNELS), weights=list(CHANNELS.values()))[0]
+        games.append([day, names[away], names[home], channel])
+    games.sort(key=lambda game: game[0])
+
+    rows = [["AWAY", "HOME", "DATE", "DAY", "CHANNEL"]]
+    for day, away, home, channel in games:
+        date = SEASON_START + datetime.timedelta(days=day - 1)
+        rows.append([away, home, "{}/{}".format(date.month, date.day), day, channel])
+    write_csv("{}/games.csv".format(folder), rows)
+
+    rows = [["Código del árbitro", "Tipo de árbitro", "Sueldo mensual [USD]",
+             "Pago adicional por partido dirigido [USD]", "Ciudad en que vive", ""]]
+    for r in range(referees):
+        type = rng.choices(list(REFEREE_TYPES), weights=list(REFEREE_TYPES.values()))[0]
+        rows.append([r + 1, type, rng.randint(4000, 7000), rng.randint(200, 400),
+                     "City {}, ST".format(rng.randrange(cities) + 1), ""])
+    write_csv("{}/referees.csv".format(folder), rows, bom=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una liga sintetica con el formato de la carpeta datos")
+    parser.add_argument("carpeta")
+    parser.add_argument("--equipos", type=int, default=30)
+    parser.add_argument("--ciudades", type=int, default=None, help="por defecto una por equipo")
+    parser.add_argument("--arbitros", type=int, default=121)
+    parser.add_argument("--dias", type=int, default=177, help="a lo mas {}".format(MAX_DAYS))
+    parser.add_argument("--partidos-por-equipo", type=int, default=82)
+    parser.add_argument("--espn", type=float, default=0.07, help="proporcion de partidos de ESPN")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.carpeta, args.equipos, args.ciudades, args.arbitros, args.dias, args.partidos_por_equipo,
+             args.espn, args.seed)
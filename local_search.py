@@ -0,0 +1,238 @@
+import argparse
+import bisect
+import time
+
+import numpy as np
+
+import clases
+import solvers
+
+
+class LocalSearch:
+    # mejora una temporada ya resuelta con cambios de arbitros; el costo de cada movimiento se calcula con los
+    # componentes de vuelos, hoteles y aditional_income de los arbitros involucrados, sin recalcular la temporada
+    def __init__(self, nba):
+        self.nba = nba
+        refs = list(nba.referees.values())
+        self.refs = refs
+        self.flights = nba.flight_table.tolist()
+        self.hotel = np.array([city.hotel_cost for city in nba.cities.values()], dtype=np.int64).tolist()
+        self.home = [ref.home.index for ref in refs]
+        self.aditional_income = [ref.aditional_income for ref in refs]
+        self.can_be_principal = ["principal" in ref.type for ref in refs]
+        self.can_be_colaborador = ["colaborador" in ref.type for ref in refs]
+        self.eligibility = nba.eligibility
+        self.day = [game.day for game in nba.game_list]
+        self.city = [game.home.city.index for game in nba.game_list]
+        self.season_end = nba.season_end
+
+        # slots of each game: [principal, colaborador, ...] with Referee.index
+        self.slots = [[game.principal.index] + [ref.index for ref in game.colaboradores] for game in nba.game_list]
+        self.sequence = [[game.index for game in ref.refgames] for ref in refs]  # Game.index sorted by day
+        self.from_home = [None] * len(refs)  # per game of the sequence, if the referee came from home
+        self.cost = [0] * len(refs)
+        for r in range(len(refs)):
+            self.cost[r], self.from_home[r] = self.simulate(r, self.sequence[r])
+        self.total = sum(self.cost)
+
+    def simulate(self, r, sequence):
+        # cost of referee r arbitrating the games of 'sequence', following the rules of update_all_refs and
+        # move_home. Returns (cost, from_home) or None if the sequence breaks a rule
+        maximo_de_partidos = self.nba.config.maximo_de_partidos
+        if maximo_de_partidos and len(sequence) > maximo_de_partidos:
+            return None
+
+        flights, hotel = self.flights, self.hotel
+        home, aditional_income = self.home[r], self.aditional_income[r]
+        seven_days_out, four_days_out = 1, 8
+        cost = 0
+        city, last, days_away = home, 0, 0  # days_away at the end of the last day refereed
+        from_home = []
+        for g in sequence:
+            day, game_city = self.day[g], self.city[g]
+            if city != home:
+                max_days_away = 7 if seven_days_out > 0 else 6 if four_days_out > 0 else 3
+                moved = min(last + 3, last + max(max_days_away - days_away, 0))  # day it goes back home
+                if moved < day:
+                    cost += flights[city][home]
+                    if days_away >= 7:
+                        seven_days_out -= 1
+                    if days_away >= 4:
+                        four_days_out -= 1
+                    city = home
+                    if max(moved - last, 1) + day - moved - 1 <= 3:  # resting
+                        return None
+                else:
+                    cost += flights[city][game_city] + (hotel[city] + aditional_income) * (day - last - 1)
+                    days_away += day - last
+            if city == home:
+                cost += flights[home][game_city]
+                days_away = 1
+            from_home.append(city == home)
+            cost += hotel[game_city] + aditional_income
+            city, last = game_city, day
+
+        if city != home:
+            cost += flights[city][home]
+        return int(cost), from_home
+
+    def local_cost(self, r, k, city):
+        # cost of the legs of referee r around position k of its sequence if that game were in 'city'
+        flights, hotel = self.flights, self.hotel
+        sequence, from_home = self.sequence[r], self.from_home[r]
+        home, aditional_income = self.home[r], self.aditional_income[r]
+        day = self.day[sequence[k]]
+
+        if from_home[k]:
+            cost = flights[home][city]
+        else:
+            previous = sequence[k - 1]
+            cost = flights[self.city[previous]][city] + \
+                (hotel[self.city[previous]] + aditional_income) * (day - self.day[previous] - 1)
+        cost += hotel[city] + aditional_income
+        if k + 1 == len(sequence) or from_home[k + 1]:
+            cost += flights[city][home]
+        else:
+            following = sequence[k + 1]
+            cost += flights[city][self.city[following]] + \
+                (hotel[city] + aditional_income) * (self.day[following] - day - 1)
+        return int(cost)
+
+    def is_principal(self, r, day):
+        # if referee r is principal of a game on 'day'
+        for g in self.sequence[r]:
+            if self.day[g] == day:
+                return self.slots[g][0] == r
+        return False
+
+    def can_take(self, r, g, principal):
+        if not self.eligibility[r, g]:
+            return False
+        if principal:
+            day = self.day[g]
+            return self.can_be_principal[r] and not self.is_principal(r, day - 1) and \
+                not self.is_principal(r, day + 1)
+        return self.can_be_colaborador[r]
+
+    def swap_delta(self, g1, s1, g2, s2):
+        # swap the referees of slot s1 of g1 and slot s2 of g2, both games on the same day. The days of each
+        # referee stay the same, so do its trips, and only the legs around that day change
+        a, b = self.slots[g1][s1], self.slots[g2][s2]
+        if not self.can_take(a, g2, s2 == 0) or not self.can_take(b, g1, s1 == 0):
+            return None
+        ka, kb = self.sequence[a].index(g1), self.sequence[b].index(g2)
+        return self.local_cost(a, ka, self.city[g2]) - self.local_cost(a, ka, self.city[g1]) + \
+            self.local_cost(b, kb, self.city[g1]) - self.local_cost(b, kb, self.city[g2])
+
+    def apply_swap(self, g1, s1, g2, s2, delta):
+        a, b = self.slots[g1][s1], self.slots[g2][s2]
+        self.slots[g1][s1], self.slots[g2][s2] = b, a
+        self.sequence[a][self.sequence[a].index(g1)] = g2
+        self.sequence[b][self.sequence[b].index(g2)] = g1
+        self.cost[a], self.from_home[a] = self.simulate(a, self.sequence[a])
+        self.cost[b], self.from_home[b] = self.simulate(b, self.sequence[b])
+        self.total += delta
+
+    def replace_delta(self, g, s, c):
+        # referee c takes slot s of game g; both referees change their days, so their sequences are simulated again
+        a = self.slots[g][s]
+        day = self.day[g]
+        if any(self.day[other] == day for other in self.sequence[c]) or not self.can_take(c, g, s == 0):
+            return None
+        days = [self.day[other] for other in self.sequence[c]]
+        position = bisect.bisect(days, day)
+        new_c = self.simulate(c, self.sequence[c][:position] + [g] + self.sequence[c][position:])
+        if new_c is None:
+            return None
+        new_a = self.simulate(a, [other for other in self.sequence[a] if other != g])
+        if new_a is None:
+            return None
+        return new_a[0] + new_c[0] - self.cost[a] - self.cost[c]
+
+    def apply_replace(self, g, s, c, delta):
+        a = self.slots[g][s]
+        self.slots[g][s] = c
+        self.sequence[a].remove(g)
+        days = [self.day[other] for other in self.sequence[c]]
+        self.sequence[c].insert(bisect.bisect(days, self.day[g]), g)
+        self.cost[a], self.from_home[a] = self.simulate(a, self.sequence[a])
+        self.cost[c], self.from_home[c] = self.simulate(c, self.sequence[c])
+        self.total += delta
+
+    def iterate(self):
+        # one pass over every move, applying each one that lowers the cost. Returns (moves tried, moves applied)
+        tried = applied = 0
+        for day, games in self.nba.games.items():
+            games = [game.index for game in games]
+            for i, g1 in enumerate(games):  # cambio de arbitros entre partidos del mismo dia
+                for g2 in games[i + 1:]:
+                    for s1 in range(len(self.slots[g1])):
+                        for s2 in range(len(self.slots[g2])):
+                            tried += 1
+                            delta = self.swap_delta(g1, s1, g2, s2)
+                            if delta is not None and delta < 0:
+                                self.apply_swap(g1, s1, g2, s2, delta)
+                                applied += 1
+
+        for g in range(len(self.slots)):  # otro arbitro toma el lugar, cambiando los dias de ambos
+            for s in range(len(self.slots[g])):
+                for c in np.flatnonzero(self.eligibility[:, g]).tolist():
+                    tried += 1
+                    delta = self.replace_delta(g, s, c)
+                    if delta is not None and delta < 0:
+                        self.apply_replace(g, s, c, delta)
+                        applied += 1
+        return tried, applied
+
+    def run(self, max_iterations=10, pprint=True):
+        rows = []
+        for iteration in range(1, max_iterations + 1):
+            cost = self.total
+            start = time.perf_counter()
+            tried, applied = self.iterate()
+            seconds = time.perf_counter() - start
+            rows.append({"iteration": iteration,
+                         "cost": self.total,
+                         "reduction": cost - self.total,
+                         "moves": tried,
+                         "applied": applied,
+                         "moves_per_second": int(tried / seconds) if seconds else 0})
+            if pprint:
+                print("Iteracion {iteration}: costo {cost} (-{reduction}), {moves} movimientos, {applied} aplicados, "
+                      "{moves_per_second} movimientos/s".format(**rows[-1]))
+            if not applied:
+                break
+
+        self.write_back()
+        return rows
+
+    def write_back(self):
+        # solves the season again with the new assignments, so the ledger, the stats and the referees match
+        nba = self.nba
+        schedule = {}
+        for day, games in nba.games.items():
+            schedule[day] = [[game, self.refs[self.slots[game.index][0]],
+                              [self.refs[r] for r in self.slots[game.index][1:]]] for game in games]
+        nba.reset_season()
+        nba.replay(schedule)
+
+        if nba.ledger.total != self.total:
+            raise Exception("Local search cost {} doesn't match the season cost {}".format(self.total,
+                                                                                           nba.ledger.total))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resuelve la temporada y la mejora con busqueda local")
+    parser.add_argument("--solver", choices=list(solvers.SOLVERS), default="backtrack")
+    parser.add_argument("--datos", default="datos")
+    parser.add_argument("--iteraciones", type=int, default=10)
+    args = parser.parse_args()
+
+    nba = clases.load_nba(args.datos)
+    solvers.SOLVERS[args.solver](nba).run(1)
+    print("Season total cost: {}".format(nba.ledger.total))
+    LocalSearch(nba).run(args.iteraciones)
+    print("Season total cost: {}".format(nba.ledger.total))
+
+    clases.export_all(nba)
+    clases.days_out_stats(nba, pprint=True)
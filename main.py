@@ -1,14 +1,8 @@
 import clases
 
 if __name__ == "__main__":
-    nba = clases.NBA()
-
     print("Cargando seeds")
-    nba.seed_locations("datos/locations.csv")
-    nba.seed_games("datos/games.csv")
-    nba.seed_distances("datos/distances (mi & km).csv")
-    nba.seed_flight_costs("datos/flight costs.csv")
-    nba.seed_referees("datos/referees.csv")
+    nba = clases.load_nba("datos")
     print("Seeds terminado")
 
     for key in nba.teams:
@@ -18,4 +12,4 @@ if __name__ == "__main__":
         print(game)
     print("-------------")
     for id, referee in nba.referees.items():
-        print(vars(referee))
\ No newline at end of file
+        print(referee.debug())
\ No newline at end of file
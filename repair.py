@@ -0,0 +1,166 @@
+import argparse
+import time
+
+import clases
+import solvers
+
+
+class MoveGame:
+    # el partido se juega otro dia
+    def __init__(self, game, day):
+        self.game = game
+        self.day = day
+
+    def first_day(self, nba):
+        return min(self.game.day, self.day)
+
+    def last_day(self, nba):
+        return max(self.game.day, self.day)
+
+    def apply(self, nba):
+        nba.move_game(self.game, self.day)
+
+
+class RefereeUnavailable:
+    # el arbitro no puede arbitrar entre 'from_day' y 'to_day' (inclusive)
+    def __init__(self, referee, from_day, to_day):
+        self.referee = referee
+        self.from_day = from_day
+        self.to_day = to_day
+
+    def first_day(self, nba):
+        # the first of its games in those days, None if it has none and the schedule stays the same
+        days = [game.day for game in self.referee.refgames if self.from_day <= game.day <= self.to_day]
+        return min(days) if days else None
+
+    def last_day(self, nba):
+        return self.to_day
+
+    def apply(self, nba):
+        games = [game.index for game in nba.game_list if self.from_day <= game.day <= self.to_day]
+        nba.eligibility[self.referee.index, games] = False
+
+
+class FareChange:
+    # el vuelo de 'from_city' a 'to_city' cuesta 'cost' desde 'from_day'; los vuelos anteriores quedan con la tarifa
+    # antigua
+    def __init__(self, from_city, to_city, cost, from_day):
+        self.from_city = from_city
+        self.to_city = to_city
+        self.cost = cost
+        self.from_day = from_day
+
+    def first_day(self, nba):
+        return self.from_day
+
+    def last_day(self, nba):
+        return nba.season_end  # every day after it has other costs, it never merges back
+
+    def apply(self, nba):
+        self.from_city.add_flight(self.to_city, self.cost)
+
+
+class Repair:
+    # cambia una temporada ya resuelta: deja fijas las asignaciones antes del primer dia afectado, resuelve con el
+    # backtracking desde ese dia y, cuando el estado de los arbitros vuelve a ser el de la temporada anterior
+    # (NBA.fingerprint) despues del ultimo dia afectado, sigue con las asignaciones anteriores
+    def __init__(self, nba):
+        self.nba = nba
+
+    def run(self, changes, pprint=True):
+        nba = self.nba
+        start = time.perf_counter()
+        old = nba.schedule()
+        old_cost = nba.ledger.total
+        rankings = {game: (game.valid_referees, game.i_valid_referees) for game in nba.game_list}
+
+        days = [change.first_day(nba) for change in changes]
+        days = [day for day in days if day is not None]
+        if not days:  # nothing to change in the schedule
+            for change in changes:
+                change.apply(nba)
+            return self.summary(None, None, old_cost, start, pprint)
+        day = min(days)
+        last = max(change.last_day(nba) for change in changes)
+
+        # the old season up to 'day', and its fingerprint at the start of each of the next days
+        nba.reset_season()
+        nba.replay(old, to_day=day)
+        frozen = nba.snapshot()
+        fingerprints = {}  # dict with {[DATE] = NBA.fingerprint}
+        for following in range(day, nba.season_end):
+            fingerprints[following] = nba.fingerprint()
+            nba.replay(old, following, following + 1)
+
+        nba.restore(frozen)
+        for change in changes:
+            change.apply(nba)
+
+        merged = []  # day where the new season is back to the old one
+
+        def until(following):
+            if following > last and fingerprints.get(following) == nba.fingerprint():
+                merged.append(following)
+                return True
+            return False
+
+        bk = clases.Backtrack(nba)
+        bk.until = until
+        if not bk.run(day):
+            raise Exception("No se encontro solucion desde el dia {}".format(day))
+
+        if merged:
+            nba.replay(old, from_day=merged[0])
+            for game in nba.game_list:  # the rankings of those days are the same as before
+                if game.day >= merged[0]:
+                    game.valid_referees, game.i_valid_referees = rankings[game]
+        return self.summary(day, merged[0] if merged else None, old_cost, start, pprint)
+
+    def summary(self, day, merged, old_cost, start, pprint):
+        row = {"first_day": day,
+               "merged_day": merged,
+               "days_solved": (merged or self.nba.season_end) - day if day else 0,
+               "old_cost": old_cost,
+               "cost": self.nba.ledger.total,
+               "delta": self.nba.ledger.total - old_cost,
+               "seconds": round(time.perf_counter() - start, 3)}
+        if pprint:
+            merge = "vuelve a la temporada anterior el dia {merged_day}" if merged else "no vuelve a la temporada anterior"
+            print(("Dia afectado {first_day}, " + merge + " ({days_solved} dias resueltos). "
+                   "Costo {old_cost} -> {cost} ({delta:+d}) en {seconds} s").format(**row))
+        return row
+
+
+def find_game(nba, day, home):
+    for game in nba.games.get(day, []):
+        if game.home.code == home:
+            return game
+    raise Exception("No hay partido de {} el dia {}".format(home, day))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resuelve la temporada y la repara despues de cambios")
+    parser.add_argument("--solver", choices=list(solvers.SOLVERS), default="backtrack")
+    parser.add_argument("--datos", default="datos")
+    parser.add_argument("--mover", nargs=3, action="append", default=[], metavar=("DIA", "LOCAL", "NUEVO_DIA"),
+                        help="mueve el partido del equipo LOCAL del DIA a NUEVO_DIA")
+    parser.add_argument("--no-disponible", nargs=3, action="append", default=[], metavar=("ARBITRO", "DESDE", "HASTA"),
+                        help="el ARBITRO no puede arbitrar entre esos dias")
+    parser.add_argument("--tarifa", nargs=4, action="append", default=[], metavar=("DESDE", "HASTA", "COSTO", "DIA"),
+                        help="el vuelo entre las ciudades de esos equipos cuesta COSTO desde DIA")
+    args = parser.parse_args()
+
+    nba = clases.load_nba(args.datos)
+    solvers.SOLVERS[args.solver](nba).run(1)
+
+    changes = []
+    for day, home, new_day in args.mover:
+        changes.append(MoveGame(find_game(nba, int(day), home), int(new_day)))
+    for referee, from_day, to_day in args.no_disponible:
+        changes.append(RefereeUnavailable(nba.referees[referee], int(from_day), int(to_day)))
+    for from_team, to_team, cost, day in args.tarifa:
+        changes.append(FareChange(nba.teams[from_team].city, nba.teams[to_team].city, int(cost), int(day)))
+    Repair(nba).run(changes)
+
+    clases.export_all(nba)
+    clases.days_out_stats(nba, pprint=True)
@@ -0,0 +1,363 @@
+import argparse
+
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, linear_sum_assignment, milp
+from scipy.sparse import coo_matrix
+
+import clases
+
+
+def day_slots(games):
+    # one slot per referee needed: [game position, is principal], ESPN games need two colaboradores
+    slots = []
+    for j, game in enumerate(games):
+        slots.append([j, True])
+        for _ in range(2 if game.channel and game.channel.name == "ESPN" else 1):
+            slots.append([j, False])
+    return slots
+
+
+def to_assignments(games, refs, slots, rows, columns):
+    # [game, principal, [colaboradores]] for every game, from the referees (rows) matched to the slots (columns)
+    assignments = [[game, None, []] for game in games]
+    for r, s in zip(rows.tolist(), columns.tolist()):
+        j, principal = slots[s]
+        if principal:
+            assignments[j][1] = refs[r]
+        else:
+            assignments[j][2].append(refs[r])
+    return assignments
+
+
+class MatchingSolver:
+    # resuelve cada dia de una vez como un problema de asignacion de costo minimo entre arbitros y cupos
+    def __init__(self, nba):
+        self.nba = nba
+
+    def slot_costs(self, day, costs):
+        # referees x slots matrix with the cost of the pair, inf when the referee can't take the slot
+        games = self.nba.games[day]
+        refs = list(self.nba.referees.values())
+        slots = day_slots(games)
+
+        # like the heuristic of next_referee_to_asign, a referee that hasn't refereed yet is taken when it costs up
+        # to rango_de_escoger_arbitros times more; only for choosing, the ledger gets the real costs
+        rango_de_escoger_arbitros = self.nba.config.rango_de_escoger_arbitros
+
+        matrix = np.full((len(refs), len(slots)), np.inf)
+        eligible = self.nba.day_eligibility(day)
+        for r, j in zip(*np.nonzero(eligible)):  # static rules first, dynamic ones only for the survivors
+            ref, game = refs[r], games[j]
+            if not ref.is_available(game):
+                continue
+
+            can_be_principal = "principal" in ref.type and ref.can_be_principal(game)
+            can_be_colaborador = "colaborador" in ref.type
+            cost = costs[r, j] if ref.refgames else costs[r, j] / rango_de_escoger_arbitros
+            for s, (slot_game, principal) in enumerate(slots):
+                if slot_game == j and (can_be_principal if principal else can_be_colaborador):
+                    matrix[r, s] = cost
+        return matrix, slots
+
+    def solve_day(self, day):
+        games = self.nba.games[day]
+        refs = list(self.nba.referees.values())
+
+        costs = self.nba.cost_matrix(games)
+        for game, ranking in zip(games, self.nba.rank_referees(games, costs)):
+            game.valid_referees = ranking
+
+        matrix, slots = self.slot_costs(day, costs)
+        try:
+            rows, columns = linear_sum_assignment(matrix)
+        except ValueError:
+            raise Exception("No se pudo encontrar un referee para todos los partidos del dia {}".format(day))
+
+        return to_assignments(games, refs, slots, rows, columns)
+
+    def run(self, day=1):
+        for day in range(day, self.nba.season_end):
+            if day in self.nba.games:
+                self.nba.commit_day(day, self.solve_day(day))
+            else:  # SOME DAYS DON'T HAVE GAMES
+                self.nba.update_all_refs(day)
+
+        self.nba.finish_season(self.nba.season_end)
+        return True
+
+
+class RollingHorizonSolver:
+    # MILP sobre una ventana de 'window' dias desde el dia actual; se fija el primer dia y la ventana avanza.
+    # Cada variable es un camino de un arbitro por los partidos de la ventana (con el rol en cada uno), simulado dia
+    # a dia con las mismas reglas de is_valid y update_all_refs, asi que todos los caminos se pueden cumplir
+    def __init__(self, nba, window=2, candidates=None, time_limit=30, gap=0):
+        self.nba = nba
+        self.window = window
+        # referees kept per game and role on the days after the first one, the cheapest from the current state;
+        # None keeps all of them
+        self.candidates = candidates
+        self.time_limit = time_limit  # seconds per window
+        self.gap = gap  # relative optimality gap of each window
+        self.fallback = MatchingSolver(nba)
+        self.fallbacks = 0  # windows solved by the matching solver because the MILP had no solution
+        self.flights = None  # NBA.flight_table as lists, for the paths
+        self.hotel = None  # hotel cost of each City.index
+
+    def start(self, ref, day):
+        # [city, resting, days_away, last_day, seven_days_out, four_days_out, games, last day as principal]
+        state = self.nba.state
+        i = ref.index
+        principal_day = day - 1 if self.nba.occupancy[i, day - 1] & 3 == clases.PRINCIPAL else -1
+        return (int(state.city[i]), int(state.resting[i]), int(state.days_away[i]), int(state.last_day[i]),
+                int(state.seven_days_out[i]), int(state.four_days_out[i]), len(ref.refgames), principal_day)
+
+    def assign(self, ref, state, game, principal):
+        # state and cost after Referee.assign_game, None if Referee.is_valid doesn't allow it
+        city, resting, days_away, last_day, seven, four, games, principal_day = state
+        at_home = city == ref.home.index
+        if at_home and resting <= 3:
+            return None
+        if days_away > (7 if seven > 0 else 6 if four > 0 else 3):
+            return None
+        if principal and principal_day == game.day - 1:
+            return None
+        maximo_de_partidos = self.nba.config.maximo_de_partidos
+        if maximo_de_partidos and games >= maximo_de_partidos:
+            return None
+
+        to = game.home.city.index
+        cost = self.flights[city][to] + ref.aditional_income + self.hotel[to]
+        if not at_home and game.day - last_day > 1:
+            cost += (ref.aditional_income + self.hotel[city]) * (game.day - last_day - 1)
+        state = (to, resting, days_away, game.day, seven, four, games + 1, game.day if principal else principal_day)
+        return state, cost
+
+    def end_day(self, ref, state, day):
+        # state and cost after NBA.update_all_refs(day)
+        city, resting, days_away, last_day, seven, four, games, principal_day = state
+        home = ref.home.index
+        if city == home:
+            return (city, resting + 1, 0, last_day, seven, four, games, principal_day), 0
+
+        days_away += 1
+        if day - last_day < 3 and days_away < (7 if seven > 0 else 6 if four > 0 else 3):
+            return (city, 0, days_away, last_day, seven, four, games, principal_day), 0
+
+        # Referee.move_home
+        gap = day - last_day
+        out = days_away - gap
+        seven -= out >= 7
+        four -= out >= 4
+        return (home, 1 + max(gap - 1, 0), 0, last_day, seven, four, games, principal_day), self.flights[city][home]
+
+    def paths(self, ref, day, days, options):
+        # every [cost, [(game position, is principal)]] of the referee on the window with at least one game. The cost
+        # counts the flight back home at the end of the window instead of the one from where it is now, like
+        # NBA.cost_matrix, so doing nothing costs 0
+        home = ref.home.index
+        state = self.start(ref, day)
+        before = self.flights[state[0]][home] if state[0] != home else 0
+        found = []
+
+        def visit(k, state, cost, taken):
+            if k == len(days):
+                if taken:
+                    after = self.flights[state[0]][home] if state[0] != home else 0
+                    found.append([cost + after - before, taken])
+                return
+            for j, game, principal in options.get(days[k], ()):
+                step = self.assign(ref, state, game, principal)
+                if step is not None:
+                    following, extra = self.end_day(ref, step[0], days[k])
+                    visit(k + 1, following, cost + step[1] + extra, taken + [(j, principal)])
+            following, extra = self.end_day(ref, state, days[k])
+            visit(k + 1, following, cost + extra, taken)
+
+        visit(0, state, 0, [])
+        return found
+
+    def solve_window(self, day):
+        nba = self.nba
+        refs = list(nba.referees.values())
+        days = list(range(day, min(day + self.window, nba.season_end)))
+        games = [game for d in days for game in nba.games.get(d, [])]
+        first = len(nba.games[day])
+        self.flights = nba.flight_table.tolist()
+        self.hotel = [city.hotel_cost for city in nba.cities.values()]
+
+        costs = nba.cost_matrix(games)  # from the current state: rankings of the first day and candidates of the others
+        for game, ranking in zip(games[:first], nba.rank_referees(games[:first], costs[:, :first])):
+            game.valid_referees = ranking
+
+        options = {}  # {Referee.index: {day: [(game position, Game, is principal)]}}
+        for j, game in enumerate(games):
+            for principal in (True, False):
+                allowed = [ref for ref in refs if nba.eligibility[ref.index, game.index] and
+                           ("principal" if principal else "colaborador") in ref.type]
+                if j >= first and self.candidates:
+                    allowed.sort(key=lambda ref: costs[ref.index, j])
+                    allowed = allowed[:self.candidates]
+                for ref in allowed:
+                    options.setdefault(ref.index, {}).setdefault(game.day, []).append((j, game, principal))
+
+        # variables: [referee, cost, [(game position, is principal)]]
+        paths = [[ref, cost, taken] for ref in refs if ref.index in options
+                 for cost, taken in self.paths(ref, day, days, options[ref.index])]
+
+        rows, columns, lower, upper = [], [], [], []
+        referee_row = {}  # cada arbitro sigue a lo mas un camino
+        slot_row = {}  # cada partido con su principal y colaboradores
+        for j, game in enumerate(games):
+            colaboradores = 2 if game.channel and game.channel.name == "ESPN" else 1
+            slot_row[(j, True)] = len(lower)
+            slot_row[(j, False)] = len(lower) + 1
+            lower += [1, colaboradores]
+            upper += [1, colaboradores]
+        for v, (ref, cost, taken) in enumerate(paths):
+            if ref.index not in referee_row:
+                referee_row[ref.index] = len(lower)
+                lower.append(0)
+                upper.append(1)
+            rows.append(referee_row[ref.index])
+            columns.append(v)
+            for slot in taken:
+                rows.append(slot_row[slot])
+                columns.append(v)
+
+        # the referees that haven't refereed yet are preferred as in MatchingSolver.slot_costs
+        rango_de_escoger_arbitros = nba.config.rango_de_escoger_arbitros
+        objective = np.array([cost if ref.refgames else cost / rango_de_escoger_arbitros for ref, cost, taken in paths],
+                             dtype=float)
+        matrix = coo_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(lower), len(paths))).tocsr()
+        result = milp(objective, constraints=LinearConstraint(matrix, lower, upper),
+                      integrality=np.ones(len(paths)), bounds=Bounds(0, 1),
+                      options={"time_limit": self.time_limit, "mip_rel_gap": self.gap})
+        if result.x is None:
+            return None
+
+        assignments = [[game, None, []] for game in games[:first]]
+        for v, (ref, cost, taken) in enumerate(paths):
+            if result.x[v] > 0.5:
+                for j, principal in taken:
+                    if j < first:
+                        if principal:
+                            assignments[j][1] = ref
+                        else:
+                            assignments[j][2].append(ref)
+        return assignments
+
+    def run(self, day=1):
+        for day in range(day, self.nba.season_end):
+            if day in self.nba.games:
+                assignments = self.solve_window(day)
+                if assignments is None:
+                    self.fallbacks += 1
+                    assignments = self.fallback.solve_day(day)
+                self.nba.commit_day(day, assignments)
+            else:  # SOME DAYS DON'T HAVE GAMES
+                self.nba.update_all_refs(day)
+
+        self.nba.finish_season(self.nba.season_end)
+        return True
+
+
+class BeamSearchSolver:
+    # guarda los 'width' mejores calendarios parciales al final de cada dia y expande cada uno con las 'k' mejores
+    # asignaciones del dia siguiente; el puntaje es el costo acumulado mas los vuelos de vuelta a casa pendientes
+    def __init__(self, nba, width=5, k=3):
+        self.nba = nba
+        self.width = width
+        self.k = k
+        self.matching = MatchingSolver(nba)
+
+    def day_options(self, day):
+        # up to k assignments of the day: the min-cost matching and, for each of its pairs, the best matching
+        # without that pair (first level of Murty's k-best), cheapest first
+        games = self.nba.games[day]
+        refs = list(self.nba.referees.values())
+
+        costs = self.nba.cost_matrix(games)
+        for game, ranking in zip(games, self.nba.rank_referees(games, costs)):
+            game.valid_referees = ranking
+
+        matrix, slots = self.matching.slot_costs(day, costs)
+        try:
+            rows, columns = linear_sum_assignment(matrix)
+        except ValueError:
+            return []
+
+        options = {tuple(columns.tolist()): [matrix[rows, columns].sum(), rows, columns]}
+        if self.k > 1:
+            for r, s in zip(rows.tolist(), columns.tolist()):
+                cost, matrix[r, s] = matrix[r, s], np.inf
+                try:
+                    other_rows, other_columns = linear_sum_assignment(matrix)
+                    options[tuple(other_columns.tolist())] = [matrix[other_rows, other_columns].sum(), other_rows,
+                                                              other_columns]
+                except ValueError:
+                    pass
+                matrix[r, s] = cost
+
+        options = sorted(options.values(), key=lambda option: option[0])[:self.k]
+        return [to_assignments(games, refs, slots, rows, columns) for cost, rows, columns in options]
+
+    def score(self):
+        state = self.nba.state
+        return self.nba.ledger.total + int(self.nba.flight_table[state.city, state.home].sum())
+
+    def run(self, day=1):
+        nba = self.nba
+        beam = [nba.snapshot()]
+        for day in range(day, nba.season_end):
+            candidates = []  # [score, SeasonSnapshot]
+            for snapshot in beam:
+                nba.restore(snapshot)
+                if day not in nba.games:  # SOME DAYS DON'T HAVE GAMES
+                    nba.update_all_refs(day)
+                    candidates.append([self.score(), nba.snapshot()])
+                    continue
+
+                for assignments in self.day_options(day):
+                    nba.restore(snapshot)
+                    nba.commit_day(day, assignments)
+                    candidates.append([self.score(), nba.snapshot()])
+
+            if not candidates:
+                raise Exception("No se pudo encontrar un referee para todos los partidos del dia {}".format(day))
+            candidates.sort(key=lambda candidate: candidate[0])
+            beam = [snapshot for score, snapshot in candidates[:self.width]]
+
+        nba.restore(beam[0])
+        nba.finish_season(nba.season_end)
+        return True
+
+
+SOLVERS = {"backtrack": clases.Backtrack,
+           "matching": MatchingSolver,
+           "milp": RollingHorizonSolver,
+           "beam": BeamSearchSolver}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resuelve la temporada con el solver escogido y exporta resultados")
+    parser.add_argument("--solver", choices=list(SOLVERS), default="matching")
+    parser.add_argument("--datos", default="datos")
+    parser.add_argument("--maximo", type=int, default=None, help="maximo_de_partidos")
+    parser.add_argument("--rango", type=float, default=1.00, help="rango_de_escoger_arbitros")
+    parser.add_argument("--ventana", type=int, default=2, help="dias de la ventana del solver milp")
+    parser.add_argument("--ancho", type=int, default=5, help="calendarios que guarda el solver beam en cada dia")
+    parser.add_argument("--k", type=int, default=3, help="asignaciones del dia siguiente con que el solver beam expande "
+                                                         "cada calendario")
+    args = parser.parse_args()
+
+    nba = clases.load_nba(args.datos, clases.SolverConfig(args.maximo, args.rango))
+    if args.solver == "milp":
+        RollingHorizonSolver(nba, window=args.ventana).run(1)
+    elif args.solver == "beam":
+        BeamSearchSolver(nba, width=args.ancho, k=args.k).run(1)
+    else:
+        SOLVERS[args.solver](nba).run(1)
+
+    clases.export_all(nba)
+    clases.days_out_stats(nba, pprint=True)
+    print("Season total cost: {}".format(nba.ledger.total))
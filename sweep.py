@@ -0,0 +1,72 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import pickle
+import time
+
+from tabulate import tabulate
+
+import clases
+
+season = None  # pickled NBA already seeded, one per worker
+
+
+def init_worker(folder):
+    global season
+    season = pickle.dumps(clases.load_nba(folder))  # los seeds se cargan una vez por proceso
+
+
+def solve(params):
+    maximo_de_partidos, rango_de_escoger_arbitros = params
+    nba = pickle.loads(season)
+    nba.config = clases.SolverConfig(maximo_de_partidos, rango_de_escoger_arbitros)
+
+    row = {"maximo_de_partidos": maximo_de_partidos,
+           "rango_de_escoger_arbitros": rango_de_escoger_arbitros}
+    start = time.perf_counter()
+    try:
+        if not clases.Backtrack(nba).run(1):
+            raise Exception("No se encontro solucion")
+        row["season_cost"] = nba.ledger.total
+        row.update(nba.stats.summary())
+    except Exception as e:  # configuraciones infactibles quedan en la tabla con su error
+        row["error"] = str(e)
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def sweep(maximos, rangos, folder="datos", processes=None):
+    grid = list(itertools.product(maximos, rangos))
+    clases.load_nba(folder)  # deja el cache de la temporada listo para los workers
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(folder,)) as pool:
+        return pool.map(solve, grid)
+
+
+def export_sweep(rows, file="resultados/sweep.csv", pprint=True):
+    fieldnames = ["maximo_de_partidos", "rango_de_escoger_arbitros", "season_cost"] + \
+                 list(clases.SolverStats().summary()) + ["seconds", "error"]
+    with open(file, "w") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    if pprint:
+        print(tabulate([[row.get(field, "") for field in fieldnames] for row in rows], headers=fieldnames))
+
+
+def parse_maximo(value):
+    return None if value.lower() == "none" else int(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corre el backtracking para una grilla de parametros")
+    parser.add_argument("--maximos", nargs="+", type=parse_maximo, default=[None, 40, 30],
+                        help="valores de maximo_de_partidos ('none' es sin limite)")
+    parser.add_argument("--rangos", nargs="+", type=float, default=[1.00, 1.05, 1.10],
+                        help="valores de rango_de_escoger_arbitros")
+    parser.add_argument("--datos", default="datos")
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
+
+    export_sweep(sweep(args.maximos, args.rangos, args.datos, args.procesos))
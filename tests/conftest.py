@@ -0,0 +1,11 @@
+import pytest
+
+import generator
+
+
+@pytest.fixture
+def league(tmp_path):
+    # folder with a small generated league, solved by every solver in about a second
+    folder = tmp_path / "liga"
+    generator.generate(folder, teams=10, referees=40, days=40, games_per_team=20, seed=0)
+    return folder
@@ -0,0 +1,57 @@
+import pytest
+
+import clases
+import generator
+
+
+class DeadEndBacktrack(clases.Backtrack):
+    # the first frame of 'dead_day' has no candidates, so the search has to undo the assignment that completed the
+    # day before (and the day transition) and take another one
+    def __init__(self, nba, dead_day):
+        super().__init__(nba)
+        self.dead_day = dead_day
+
+    def day_frame(self, day):
+        if day == self.dead_day:
+            self.dead_day = None
+            return [day, [], 0, None]
+        return super().day_frame(day)
+
+
+def test_undo_matches_a_clean_replay(tmp_path):
+    generator.generate(tmp_path, teams=6, referees=16, days=30, games_per_team=16, seed=0)
+    nba = clases.load_nba(tmp_path, cache=False)
+    nba.metrics = clases.SolverMetrics(nba.season_end + 1)
+
+    bk = DeadEndBacktrack(nba, 10)  # goes back through several assignments of the days before
+    assert bk.run(1)
+    assert sum(nba.metrics.undos) > 0
+
+    schedule = nba.schedule()
+    total = nba.ledger.total
+    stats = vars(nba.stats).copy()
+    occupancy = nba.occupancy.copy()
+    state = {name: getattr(nba.state, name).copy() for name in clases.RefereeState.DYNAMIC}
+
+    nba.reset_season()
+    nba.replay(schedule)
+
+    assert nba.ledger.total == total
+    assert vars(nba.stats) == stats
+    assert (nba.occupancy == occupancy).all()
+    for name, array in state.items():
+        assert (getattr(nba.state, name) == array).all(), name
+
+
+def test_undo_out_of_order_is_rejected(league):
+    nba = clases.load_nba(league, cache=False)
+    game = nba.games[min(nba.games)][0]
+    first, second = [ref for ref in nba.referees.values() if ref.is_valid(game)][:2]
+    first.assign_game(game)
+    second.assign_game(game)
+
+    with pytest.raises(Exception, match="out of order"):
+        first.undo_assign_game(game)
+    second.undo_assign_game(game)
+    first.undo_assign_game(game)
+    assert nba.ledger.total == 0
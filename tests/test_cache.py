@@ -0,0 +1,34 @@
+import csv
+import os
+
+import clases
+import generator
+
+
+def test_cache_is_rebuilt_when_a_csv_changes(league):
+    clases.load_nba(league)  # writes the cache
+    nba = clases.load_nba(league)
+    assert "seed_arrays" in nba.load_times
+    referee = next(iter(nba.referees.values()))
+
+    file = league / "referees.csv"
+    with open(file, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    rows[1][3] = str(int(rows[1][3]) + 1)  # pago adicional por partido del primer arbitro
+    generator.write_csv(file, rows, bom=True)
+
+    nba = clases.load_nba(league)
+    assert "seed_arrays" not in nba.load_times
+    assert next(iter(nba.referees.values())).aditional_income == referee.aditional_income + 1
+    assert "seed_arrays" in clases.load_nba(league).load_times
+
+
+def test_failed_cache_save_leaves_no_temporary_file(league, monkeypatch):
+    def savez(file, **arrays):
+        file.write(b"PK")  # half written
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(clases.np, "savez", savez)
+    nba = clases.load_nba(league)
+    assert "seed_locations" in nba.load_times
+    assert [name for name in os.listdir(league) if name.startswith(clases.SEASON_CACHE)] == []
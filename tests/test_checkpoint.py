@@ -0,0 +1,24 @@
+import clases
+
+
+def summary(nba):
+    # what a finished season has to match: the schedule by indexes, the cost, the stats and the occupancy
+    schedule = {day: [[game.index, game.principal.index, [ref.index for ref in colaboradores]]
+                      for game, principal, colaboradores in games]
+                for day, games in nba.schedule().items()}
+    return schedule, nba.ledger.total, vars(nba.stats), nba.occupancy.tolist()
+
+
+def test_resume_from_any_checkpoint_matches_a_full_run(league, tmp_path):
+    nba = clases.load_nba(league, cache=False)
+    bk = clases.Backtrack(nba)
+    days = [2, nba.season_end // 3, nba.season_end // 2, nba.season_end - 1]
+    bk.checkpoint_days = set(days)
+    bk.checkpoint_file = str(tmp_path / "checkpoint-{}.npz")
+    assert bk.run(1)
+    expected = summary(nba)
+
+    for day in days:
+        resumed = clases.load_nba(league, cache=False)
+        assert clases.Backtrack(resumed).resume(bk.checkpoint_file.format(day))
+        assert summary(resumed) == expected, day
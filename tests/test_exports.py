@@ -0,0 +1,55 @@
+import json
+import re
+
+import pytest
+
+import clases
+import solvers
+
+WRAPPERS = {"games-days": lambda nba, folder, compact: clases.export_game_days(nba, folder=folder, compact=compact),
+            "games-days-csv": lambda nba, folder, compact: clases.export_game_days_csv(nba, folder, compact),
+            "refs-info": lambda nba, folder, compact: clases.export_refs_info(nba, folder=folder),
+            "refs-info-csv": lambda nba, folder, compact: clases.export_refs_info_csv(nba, folder),
+            "history": lambda nba, folder, compact: clases.create_history(nba, folder)}
+
+
+def read(file):
+    # the reprs of the referees have their address, that changes between runs
+    with open(file) as f:
+        return re.sub("0x[0-9a-f]+", "", f.read())
+
+
+@pytest.fixture
+def nba(league):
+    nba = clases.load_nba(league, cache=False)
+    solvers.MatchingSolver(nba).run(1)
+    return nba
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_export_all_writes_the_same_files_as_the_wrappers(nba, tmp_path, compact):
+    (tmp_path / "all").mkdir()
+    (tmp_path / "wrappers").mkdir()
+    clases.export_all(nba, list(WRAPPERS), compact, folder=tmp_path / "all")
+    for name, wrapper in WRAPPERS.items():
+        wrapper(nba, tmp_path / "wrappers", compact)
+
+    for name in WRAPPERS:
+        file = clases.EXPORT_FILES[name]
+        assert read(tmp_path / "all" / file) == read(tmp_path / "wrappers" / file), name
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_season_jsonl_has_a_record_per_game_and_referee(nba, tmp_path, compact):
+    clases.export_all(nba, ["jsonl"], compact, folder=tmp_path)
+    with open(tmp_path / clases.EXPORT_FILES["jsonl"]) as f:
+        records = [json.loads(line) for line in f]
+
+    games = [record for record in records if record["record"] == "game"]
+    referees = [record for record in records if record["record"] == "referee"]
+    assert len(games) == len(nba.game_list)
+    assert len(referees) == len(nba.referees)
+    assert len(records) == len(games) + len(referees)
+    assert sum(record["total_cost"] for record in games) == nba.ledger.total
+    assert sum(record["total_cost"] for record in referees) == nba.ledger.total
+    assert all(("valid_referees" in record) != compact for record in games)
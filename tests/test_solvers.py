@@ -0,0 +1,29 @@
+import clases
+import solvers
+
+
+def solve(folder, solver, **kwargs):
+    nba = clases.load_nba(folder, cache=False)
+    solver = solver(nba, **kwargs)
+    solver.run(1)
+    return nba, solver
+
+
+def test_rolling_horizon_lookahead_beats_one_day(league):
+    one_day, _ = solve(league, solvers.RollingHorizonSolver, window=1)
+    matching, _ = solve(league, solvers.MatchingSolver)
+    nba, solver = solve(league, solvers.RollingHorizonSolver, window=2)
+
+    assert solver.fallbacks == 0  # every day from the MILP, and commit_day checked is_valid of each referee
+    assert all(game.has_all_refs() for game in nba.game_list)
+    assert nba.ledger.total < one_day.ledger.total
+    assert nba.ledger.total < matching.ledger.total
+
+
+def test_matching_honors_rango_de_escoger_arbitros(league):
+    used = []
+    for rango_de_escoger_arbitros in (1.00, 1.10):
+        nba = clases.load_nba(league, clases.SolverConfig(None, rango_de_escoger_arbitros), cache=False)
+        solvers.MatchingSolver(nba).run(1)
+        used.append(sum(1 for ref in nba.referees.values() if ref.refgames))
+    assert used[1] > used[0]